@@ -1,28 +1,109 @@
 from django.contrib import admin
 
-from .models import Comment, Group, Post
+from .models import (Comment, Group, Job, MemoryAllocation, MemoryProfile,
+                     Post)
+from .paginator import ApproximateCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'text', 'pub_date', 'author')
+class IndexedSearchMixin:
+    """Поиск ``@username`` и ``#id`` идёт по индексам, а не через LIKE по
+    всем полям ``search_fields``."""
+    author_lookup = 'author__username'
+    id_lookup = 'pk'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term.startswith('@') and len(term) > 1:
+            return queryset.filter(**{self.author_lookup: term[1:]}), False
+        if term.startswith('#') and term[1:].isdigit():
+            return queryset.filter(**{self.id_lookup: int(term[1:])}), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+class PostAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('pk', 'text', 'pub_date', 'author', 'deleted_at')
+    list_select_related = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    raw_id_fields = ('author', 'group')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        # Админка видит и скрытые записи; без фильтра по deleted_at
+        # количество для паджинатора берётся из статистики SQLite
+        queryset = Post.all_objects.all()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
-    search_fields = ('text',)
+    search_fields = ('=slug',)
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('text', 'created', 'author', 'post')
-    search_fields = ('author', 'post', 'created')
-    list_filter = ('author', 'created',)
+    list_select_related = ('author', 'post')
+    # Поиск по связанным полям давал JOIN по всей таблице, теперь
+    # '@username' ищет по автору, '#id' - по записи
+    search_fields = ('text',)
+    id_lookup = 'post_id'
+    list_filter = ('created',)
+    raw_id_fields = ('author', 'post')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'priority', 'attempts',
+                    'run_after', 'locked_by')
+    list_filter = ('status', 'name')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+
+class MemoryAllocationInline(admin.TabularInline):
+    model = MemoryAllocation
+    fields = ('site', 'size_total', 'count_total', 'requests')
+    readonly_fields = fields
+    ordering = ('-size_total',)
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class MemoryProfileAdmin(admin.ModelAdmin):
+    list_display = ('view', 'requests', 'net_avg', 'peak_avg', 'peak_max',
+                    'updated')
+    fields = ('view', 'requests', 'net_total', 'peak_total', 'peak_max',
+              'updated')
+    readonly_fields = fields
+    ordering = ('-peak_max',)
+    search_fields = ('view',)
+    inlines = (MemoryAllocationInline,)
+
+    def net_avg(self, obj):
+        return obj.net_avg
+    net_avg.short_description = 'Средний прирост, байт'
+
+    def peak_avg(self, obj):
+        return obj.peak_avg
+    peak_avg.short_description = 'Средний пик, байт'
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(MemoryProfile, MemoryProfileAdmin)
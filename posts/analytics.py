@@ -0,0 +1,172 @@
+"""Почасовая и дневная статистика вовлечённости записей и авторов.
+
+``EngagementRollup`` хранит просмотры, лайки и комментарии за час и за
+день по каждой записи и по каждому автору. Лайки и комментарии переносятся
+из своих таблиц командой ``rollup_engagement``: для каждой таблицы в
+``RollupWatermark`` запоминается последний учтённый первичный ключ, и
+обрабатываются только новые строки. Строки моложе ``ROLLUP_LAG`` секунд
+откладываются до следующего запуска, чтобы не пропустить события из ещё не
+завершённых транзакций. Просмотры приходят из частей счётчика
+(``posts.visits.fold``) и относятся к часу переноса.
+
+Лайки и комментарии, удалённые после учёта, из статистики не вычитаются:
+это число событий за период, а не текущее состояние.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Comment, EngagementRollup, Like, Post, RollupWatermark
+
+LAG = getattr(settings, 'ROLLUP_LAG', 60)
+SOURCES = {
+    'likes': Like,
+    'comments': Comment,
+}
+STEPS = {
+    EngagementRollup.HOUR: timedelta(hours=1),
+    EngagementRollup.DAY: timedelta(days=1),
+}
+
+
+def period_start(moment, period):
+    local = timezone.make_naive(moment).replace(
+        minute=0, second=0, microsecond=0
+    )
+    if period == EngagementRollup.DAY:
+        local = local.replace(hour=0)
+    return timezone.make_aware(local)
+
+
+def count(counts, post_id, author_id, moment, field, amount=1):
+    """Добавляет событие к накопленным ``counts`` по всем четырём срезам:
+    запись и автор, час и день."""
+    for period in STEPS:
+        start = period_start(moment, period)
+        counts[(period, start, post_id, None)][field] += amount
+        if author_id is not None:
+            counts[(period, start, None, author_id)][field] += amount
+
+
+def apply(counts):
+    for (period, start, post_id, author_id), values in counts.items():
+        lookup = {'period': period, 'start': start, 'post_id': post_id,
+                  'author_id': author_id}
+        rows = EngagementRollup.objects.filter(**lookup)
+        changes = {name: F(name) + value for name, value in values.items()}
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                EngagementRollup.objects.create(**lookup, **values)
+        except IntegrityError:
+            # Строку успели создать параллельно
+            rows.update(**changes)
+
+
+def new_counts():
+    return defaultdict(Counter)
+
+
+def add_views(totals, now=None):
+    """Учитывает перенесённые из частей счётчика просмотры
+    ``{post_id: количество}``. Вызывается внутри транзакции переноса."""
+    now = now or timezone.now()
+    authors = dict(Post.all_objects.filter(pk__in=totals).values_list(
+        'pk', 'author_id'
+    ))
+    counts = new_counts()
+    for post_id, total in totals.items():
+        if post_id in authors:
+            count(counts, post_id, authors[post_id], now, 'views', total)
+    apply(counts)
+
+
+def process(name, batch_size=1000, now=None):
+    """Переносит новые события таблицы ``name`` из ``SOURCES``. Возвращает
+    число учтённых строк."""
+    model = SOURCES[name]
+    cutoff = (now or timezone.now()) - timedelta(seconds=LAG)
+    watermark, _ = RollupWatermark.objects.get_or_create(name=name)
+    processed = 0
+    while True:
+        rows = list(model.objects.filter(
+            pk__gt=watermark.last_id, created__lt=cutoff
+        ).order_by('pk').values_list(
+            'pk', 'post_id', 'post__author_id', 'created'
+        )[:batch_size])
+        if not rows:
+            return processed
+        counts = new_counts()
+        for _, post_id, author_id, created in rows:
+            count(counts, post_id, author_id, created, name)
+        # Статистика и отметка меняются вместе, поэтому повторный запуск
+        # после сбоя не учтёт события дважды
+        with transaction.atomic():
+            apply(counts)
+            watermark.last_id = rows[-1][0]
+            watermark.save()
+        processed += len(rows)
+
+
+def rollup(batch_size=1000, now=None):
+    from . import visits
+
+    folded = visits.fold()
+    return {
+        'views': folded,
+        **{name: process(name, batch_size, now) for name in SOURCES},
+    }
+
+
+def series(period, start, buckets, **scope):
+    """Значения за ``buckets`` периодов начиная со ``start``, включая
+    пустые: список словарей с ``start``, ``views``, ``likes`` и
+    ``comments``."""
+    step = STEPS[period]
+    end = start + step * buckets
+    rows = {
+        row['start']: row for row in EngagementRollup.objects.filter(
+            period=period, start__gte=start, start__lt=end, **scope
+        ).values('start', 'views', 'likes', 'comments')
+    }
+    return [
+        rows.get(start + step * n, {
+            'start': start + step * n, 'views': 0, 'likes': 0,
+            'comments': 0,
+        })
+        for n in range(buckets)
+    ]
+
+
+def top_posts(author, start, end, limit=10):
+    return EngagementRollup.objects.filter(
+        period=EngagementRollup.DAY, author__isnull=True,
+        post__author=author, post__deleted_at__isnull=True,
+        start__gte=start, start__lt=end
+    ).values('post', 'post__text').annotate(
+        total_views=Sum('views'), total_likes=Sum('likes'),
+        total_comments=Sum('comments')
+    ).order_by('-total_views', '-total_likes')[:limit]
+
+
+def chart(points, field, label_format):
+    """Столбцы для SVG-графика: координаты в системе 10 x 100 на
+    столбец."""
+    top = max((point[field] for point in points), default=0) or 1
+    bars = []
+    for n, point in enumerate(points):
+        height = round(point[field] * 100 / top, 1)
+        bars.append({
+            'x': n * 10,
+            'y': 100 - height,
+            'height': height,
+            'value': point[field],
+            'label': format(timezone.localtime(point['start']),
+                            label_format),
+        })
+    return {'bars': bars, 'width': len(points) * 10, 'max': top}
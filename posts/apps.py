@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from yatube import pagecache, sqlite  # noqa: F401
+        from . import autocomplete, signals, tasks  # noqa: F401
+        pagecache.connect_signals()
@@ -0,0 +1,90 @@
+"""Помесячные архивы записей авторов и сообществ.
+
+Количество записей за месяц хранится в ``ArchiveMonth`` и обновляется
+сигналами при создании, переносе и удалении записей, поэтому список
+месяцев строится одним запросом. Сами записи месяца выбираются диапазоном
+по индексам ``(author, pub_date)`` и ``(group, pub_date)``.
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ArchiveMonth, Post
+
+
+def month_of(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def month_range(year, month):
+    """Границы месяца [начало, начало следующего) в текущем часовом поясе.
+    Для несуществующего месяца - ``ValueError``."""
+    # Год из адреса может быть любым числом, а datetime принимает только
+    # 1..9999 и на огромных значениях бросает OverflowError
+    if not datetime.MINYEAR <= year <= datetime.MAXYEAR:
+        raise ValueError(f'Год вне диапазона: {year}')
+    try:
+        start = datetime.datetime(year, month, 1)
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+        return timezone.make_aware(start), timezone.make_aware(end)
+    except OverflowError as error:
+        raise ValueError(str(error))
+
+
+def adjust(month, delta, author_id=None, group_id=None):
+    scope = {'author_id': author_id, 'group_id': group_id}
+    rows = ArchiveMonth.objects.filter(month=month, **scope)
+    if delta < 0:
+        rows = rows.filter(post_count__gte=-delta)
+    if rows.update(post_count=F('post_count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ArchiveMonth.objects.create(month=month, post_count=delta,
+                                        **scope)
+    except IntegrityError:
+        # Строку месяца успели создать параллельно
+        adjust(month, delta, author_id, group_id)
+
+
+def post_added(post, delta=1):
+    month = month_of(post.pub_date)
+    if post.author_id is not None:
+        adjust(month, delta, author_id=post.author_id)
+    if post.group_id is not None:
+        adjust(month, delta, group_id=post.group_id)
+
+
+def post_removed(post):
+    post_added(post, -1)
+
+
+def post_moved(post, old_group_id):
+    month = month_of(post.pub_date)
+    if old_group_id is not None:
+        adjust(month, -1, group_id=old_group_id)
+    if post.group_id is not None:
+        adjust(month, 1, group_id=post.group_id)
+
+
+def rebuild():
+    """Пересчитывает всю таблицу по записям; возвращает число строк."""
+    rows = []
+    for field in ('author', 'group'):
+        months = Post.objects.filter(**{f'{field}__isnull': False}).annotate(
+            month=TruncMonth('pub_date')
+        ).order_by().values(field, 'month').annotate(total=Count('pk'))
+        for row in months:
+            rows.append(ArchiveMonth(
+                month=row['month'].date() if isinstance(
+                    row['month'], datetime.datetime) else row['month'],
+                post_count=row['total'],
+                **{f'{field}_id': row[field]}
+            ))
+    with transaction.atomic():
+        ArchiveMonth.objects.all().delete()
+        ArchiveMonth.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
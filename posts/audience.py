@@ -0,0 +1,112 @@
+"""Оценка уникальных зрителей записей.
+
+Для каждой записи и дня хранится скетч HyperLogLog (``posts.hll``), в
+который ``post_view`` добавляет ключ зрителя. Повторные просмотры и
+возвраты на запись после лайка или комментария скетч не меняют, и тогда
+запись в базу не выполняется. Дневные скетчи объединяются, поэтому число
+уникальных зрителей за любой период и по любому набору записей считается
+без таблицы пар (зритель, запись).
+
+Рядом ведётся дневной скетч автора (``AuthorViewerSketch``) по всем его
+записям: статистика автора читает одну строку за день, а не объединяет
+скетчи каждой записи.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import AuthorViewerSketch, Post, ViewerSketch
+
+
+def viewer_key(request):
+    # Страница из кэша отдаётся до AuthenticationMiddleware, и
+    # request.user ещё нет - посетитель анонимный
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return 'anon:{}:{}'.format(
+        request.META.get('REMOTE_ADDR', ''),
+        request.META.get('HTTP_USER_AGENT', '')
+    )
+
+
+def add_to_sketch(model, key, attempts=3, **lookup):
+    """Добавляет ``key`` в скетч строки ``model`` с полями ``lookup``;
+    возвращает ``True``, если скетч изменился."""
+    rows = model.objects.filter(**lookup)
+    for _ in range(attempts):
+        data = rows.values_list('sketch', flat=True).first()
+        if data is None:
+            sketch = HyperLogLog()
+            sketch.add(key)
+            try:
+                with transaction.atomic():
+                    model.objects.create(sketch=sketch.to_bytes(), **lookup)
+                return True
+            except IntegrityError:
+                continue
+        data = bytes(data)
+        sketch = HyperLogLog.from_bytes(data)
+        if not sketch.add(key):
+            return False
+        # Обновляем, только если скетч не изменили параллельно
+        if rows.filter(sketch=data).update(sketch=sketch.to_bytes()):
+            return True
+    return False
+
+
+def record_view(post_id, key, day=None, author_id=None, attempts=3):
+    """Добавляет зрителя в скетч дня записи и её автора; возвращает
+    ``True``, если скетч записи изменился."""
+    day = day or timezone.localdate()
+    if not add_to_sketch(ViewerSketch, key, attempts,
+                         post_id=post_id, day=day):
+        # Зритель уже видел запись сегодня, значит, есть и в скетче автора
+        return False
+    if author_id is None:
+        author_id = Post.all_objects.filter(pk=post_id).values_list(
+            'author_id', flat=True
+        ).first()
+    if author_id is not None:
+        add_to_sketch(AuthorViewerSketch, key, attempts,
+                      author_id=author_id, day=day)
+    return True
+
+
+def merge(sketches):
+    """Объединяет скетчи из итерируемого ``ViewerSketch`` или байтов."""
+    result = HyperLogLog()
+    for data in sketches:
+        if isinstance(data, ViewerSketch):
+            data = data.sketch
+        result.merge(HyperLogLog.from_bytes(data))
+    return result
+
+
+def unique_viewers(**filters):
+    """Оценка уникальных зрителей по скетчам ``ViewerSketch``, отобранным
+    ``filters``, например ``post__author=user, day__gte=since``."""
+    return merge(ViewerSketch.objects.filter(**filters).values_list(
+        'sketch', flat=True
+    ).iterator()).count()
+
+
+def daily_unique_viewers(**filters):
+    """Список (день, уникальных зрителей) по возрастанию дней."""
+    days = {}
+    rows = ViewerSketch.objects.filter(**filters).order_by('day')
+    for day, data in rows.values_list('day', 'sketch').iterator():
+        days.setdefault(day, []).append(data)
+    return [(day, merge(sketches).count()) for day, sketches in days.items()]
+
+
+def author_daily_viewers(author, since=None):
+    """Список (день, уникальных зрителей всех записей ``author``) по
+    возрастанию дней, начиная с ``since``."""
+    rows = AuthorViewerSketch.objects.filter(author=author).order_by('day')
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    return [
+        (day, HyperLogLog.from_bytes(data).count())
+        for day, data in rows.values_list('day', 'sketch').iterator()
+    ]
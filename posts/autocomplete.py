@@ -0,0 +1,184 @@
+"""Автодополнение имён пользователей и названий сообществ.
+
+Индекс - отсортированный список кортежей (ключ, подпись, id) в памяти
+процесса; все ключи с префиксом лежат подряд, и начало диапазона находится
+двоичным поиском, поэтому запрос не обращается к базе. Для названий
+сообществ ключом служит каждое слово до конца названия: "тех" находит
+"Наука и техника".
+
+Индекс загружается при первом запросе и дальше обновляется сигналами
+сохранения и удаления: изменение строит новый список и подменяет ссылку,
+поэтому поиск идёт без блокировки. Изменения из других процессов
+замечаются по версии в кэше: при её смене индекс перечитывается целиком,
+но не чаще раза в ``AUTOCOMPLETE_CHECK_INTERVAL`` секунд.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Group
+
+LIMIT = 10
+
+
+class PrefixIndex:
+    def __init__(self, name, load, keys):
+        """``load`` возвращает пары (id, подпись) всех объектов,
+        ``keys`` - ключи подписи."""
+        self.name = name
+        self.load = load
+        self.keys = keys
+        self.lock = threading.Lock()
+        self.entries = None
+        self.labels = {}
+        self.version = None
+        self.checked = 0
+
+    @property
+    def version_key(self):
+        return f'autocomplete:{self.name}:version'
+
+    def ensure_loaded(self):
+        now = time.monotonic()
+        interval = getattr(settings, 'AUTOCOMPLETE_CHECK_INTERVAL', 5)
+        if self.entries is not None and now - self.checked < interval:
+            return
+        version = cache.get(self.version_key, 0)
+        with self.lock:
+            self.checked = now
+            if self.entries is not None and version == self.version:
+                return
+            labels = dict(self.load())
+            entries = [
+                (key, label, pk)
+                for pk, label in labels.items() for key in self.keys(label)
+            ]
+            entries.sort()
+            self.entries, self.labels, self.version = entries, labels, \
+                version
+
+    def search(self, prefix, limit=LIMIT):
+        """До ``limit`` пар (id, подпись) с ключом, начинающимся с
+        ``prefix``, без повторов."""
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        self.ensure_loaded()
+        entries = self.entries
+        found = {}
+        position = bisect.bisect_left(entries, (prefix,))
+        while position < len(entries) and len(found) < limit:
+            key, label, pk = entries[position]
+            if not key.startswith(prefix):
+                break
+            found.setdefault(pk, label)
+            position += 1
+        return list(found.items())
+
+    def reset(self):
+        with self.lock:
+            self.entries, self.labels, self.version = None, {}, None
+
+    def label(self, pk):
+        self.ensure_loaded()
+        return self.labels.get(pk)
+
+    def _bump(self):
+        try:
+            version = cache.incr(self.version_key)
+        except ValueError:
+            cache.add(self.version_key, 1, None)
+            version = cache.get(self.version_key, 1)
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+        else:
+            # Между нашими изменениями версию увеличил другой процесс - его
+            # изменение надо перечитать при следующем запросе
+            self.version = None
+            self.checked = 0
+
+    def update(self, pk, label):
+        """Заменяет подпись объекта ``pk`` (``None`` - удаляет его)."""
+        with self.lock:
+            if self.entries is None:
+                # Здесь ещё не загружен, но другим процессам нужна новая
+                # версия
+                self._bump()
+                return
+            old = self.labels.get(pk)
+            if old == label:
+                return
+            # Копия при записи: search() читает списки без блокировки и
+            # должен видеть их целиком до или после изменения
+            labels = dict(self.labels)
+            entries = list(self.entries)
+            labels.pop(pk, None)
+            if old is not None:
+                for key in self.keys(old):
+                    position = bisect.bisect_left(entries, (key, old, pk))
+                    if position < len(entries) and \
+                            entries[position] == (key, old, pk):
+                        del entries[position]
+            if label is not None:
+                labels[pk] = label
+                for key in self.keys(label):
+                    bisect.insort(entries, (key, label, pk))
+            self.entries, self.labels = entries, labels
+            self._bump()
+
+
+def username_keys(username):
+    return [username.casefold()]
+
+
+def title_keys(title):
+    words = title.casefold().split()
+    return [' '.join(words[n:]) for n in range(len(words))]
+
+
+users = PrefixIndex(
+    'users',
+    lambda: User.objects.filter(is_active=True).values_list(
+        'pk', 'username'
+    ).iterator(),
+    username_keys
+)
+groups = PrefixIndex(
+    'groups',
+    lambda: Group.objects.values_list('pk', 'title').iterator(),
+    title_keys
+)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Вход сохраняет только last_login - индекс это не меняет
+    if update_fields is not None and not {'username', 'is_active'} & set(
+            update_fields):
+        return
+    users.update(instance.pk,
+                 instance.username if instance.is_active else None)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    users.update(instance.pk, None)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    groups.update(instance.pk, instance.title)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    groups.update(instance.pk, None)
+
+
+INDEXES = {'users': users, 'groups': groups}
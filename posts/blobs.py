@@ -0,0 +1,71 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import ImageBlob, Post
+from .storage import image_storage
+
+
+def file_name(value):
+    """Имя файла из значения поля: строки, FieldFile или пустого."""
+    return getattr(value, 'name', value) or None
+
+
+def incref(name):
+    updated = ImageBlob.objects.filter(name=name).update(
+        refs=F('refs') + 1, updated=timezone.now()
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                ImageBlob.objects.create(name=name, refs=1)
+        except IntegrityError:
+            incref(name)
+
+
+def decref(name):
+    ImageBlob.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1, updated=timezone.now()
+    )
+
+
+def collect(grace, batch_size=500):
+    """Удаляет файлы без ссылок, отпустившие последнюю ссылку раньше
+    ``grace`` назад, вместе с их миниатюрами. Возвращает число
+    удалённых файлов."""
+    from sorl.thumbnail import default
+    from sorl.thumbnail.images import ImageFile
+
+    cutoff = timezone.now() - grace
+    names = list(ImageBlob.objects.filter(
+        refs=0, updated__lte=cutoff
+    ).values_list('name', flat=True)[:batch_size])
+    removed = 0
+    for name in names:
+        # Условное удаление строки: если файл успели снова использовать
+        # или загрузить, счётчик уже не нулевой или строка свежая, и файл
+        # остаётся. Файл удаляется в той же транзакции, см. posts.storage
+        with transaction.atomic():
+            if not ImageBlob.objects.filter(
+                name=name, refs=0, updated__lte=cutoff
+            ).delete()[0]:
+                continue
+            default.kvstore.delete(ImageFile(name, storage=image_storage))
+            image_storage.delete(name)
+        removed += 1
+    return removed
+
+
+def rebuild():
+    """Пересчитывает счётчики ссылок по всем записям, включая скрытые."""
+    counts = dict(
+        Post.all_objects.exclude(image='').exclude(image__isnull=True)
+        .order_by().values_list('image').annotate(total=Count('pk'))
+    )
+    with transaction.atomic():
+        ImageBlob.objects.exclude(name__in=counts).update(refs=0)
+        for name, total in counts.items():
+            ImageBlob.objects.update_or_create(
+                name=name, defaults={'refs': total}
+            )
+    return len(counts)
@@ -1,8 +1,27 @@
-from django.forms import ModelForm, Textarea
+from django.forms import ModelForm, Textarea, Widget
 
+from . import autocomplete
 from .models import Comment, Post
 
 
+class GroupAutocompleteWidget(Widget):
+    """Поле ввода с подсказками вместо списка всех сообществ. Выбранное
+    сообщество передаётся скрытым полем, а его название берётся из индекса
+    автодополнения, а не из базы."""
+    template_name = 'posts/widgets/group_autocomplete.html'
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        label = ''
+        if value not in (None, ''):
+            try:
+                label = autocomplete.groups.label(int(value)) or ''
+            except (TypeError, ValueError):
+                pass
+        context['widget']['label'] = label
+        return context
+
+
 class PostForm(ModelForm):
 
     class Meta:
@@ -15,6 +34,7 @@ class PostForm(ModelForm):
             'group': 'Сообщества',
             'text': 'Текст записи',
         }
+        widgets = {'group': GroupAutocompleteWidget}
 
 
 class CommentForm(ModelForm):
@@ -0,0 +1,32 @@
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Group, Post
+
+
+def post_added(group_id, pub_date):
+    """Новая запись всегда самая свежая в сообществе, поэтому достаточно
+    инкремента без пересчёта."""
+    Group.objects.filter(pk=group_id).update(
+        post_count=F('post_count') + 1,
+        last_post_at=pub_date
+    )
+
+
+def refresh(group_ids=None):
+    """Пересчитывает статистику указанных (или всех) сообществ одним
+    UPDATE с подзапросами по индексу ``group_id``."""
+    posts = Post.objects.filter(group=OuterRef('pk')).order_by().values(
+        'group'
+    )
+    groups = Group.objects.all()
+    if group_ids is not None:
+        groups = groups.filter(pk__in=list(group_ids))
+    return groups.update(
+        post_count=Coalesce(
+            Subquery(posts.annotate(total=Count('pk')).values('total')), 0
+        ),
+        last_post_at=Subquery(
+            posts.annotate(last=Max('pub_date')).values('last')
+        )
+    )
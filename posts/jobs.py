@@ -0,0 +1,232 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача регистрируется декоратором ``@job`` и ставится в очередь вызовом
+``enqueue()``; выполняет её команда ``manage.py run_worker``. Захват задачи
+- условный UPDATE, который проходит только у одного обработчика, поэтому
+очередь безопасна и на SQLite. Захваченная задача невидима для других
+обработчиков ``JOBS_VISIBILITY_TIMEOUT`` секунд: если обработчик упал,
+задачу подберёт следующий. Захват считается попыткой, поэтому задача, из-за
+которой падает сам обработчик, после ``max_attempts`` захватов переходит в
+FAILED, а не повторяется бесконечно. Выполненные задачи удаляются через
+``JOBS_DONE_RETENTION`` секунд.
+"""
+import base64
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import EmailMultiAlternatives
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name):
+    """Регистрирует функцию как фоновую задачу с именем ``name``."""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def visibility_timeout():
+    return timedelta(
+        seconds=getattr(settings, 'JOBS_VISIBILITY_TIMEOUT', 5 * 60)
+    )
+
+
+def enqueue(name, priority=0, delay=0, max_attempts=3, **kwargs):
+    """Ставит задачу в очередь; аргументы должны сериализоваться в JSON.
+
+    Внутри транзакции задача появится в очереди только вместе с
+    остальными изменениями."""
+    if name not in registry:
+        raise KeyError(f'Неизвестная задача: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=json.dumps(kwargs),
+        priority=priority,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay)
+    )
+
+
+def available(now):
+    return Job.objects.filter(
+        Q(status=Job.QUEUED) | Q(
+            status=Job.RUNNING, locked_until__lt=now,
+            attempts__lt=F('max_attempts')
+        ),
+        run_after__lte=now
+    )
+
+
+def expire(now=None):
+    """Переводит в FAILED зависшие задачи, у которых кончились попытки.
+    Возвращает их число."""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_until__lt=now,
+        attempts__gte=F('max_attempts')
+    ).update(
+        status=Job.FAILED, locked_until=None,
+        last_error='Обработчик не завершил задачу за отведённое время'
+    )
+
+
+def prune(now=None, batch_size=1000):
+    """Удаляет выполненные задачи старше ``JOBS_DONE_RETENTION`` секунд.
+    Возвращает их число."""
+    now = now or timezone.now()
+    cutoff = now - timedelta(
+        seconds=getattr(settings, 'JOBS_DONE_RETENTION', 24 * 60 * 60)
+    )
+    total = 0
+    while True:
+        ids = list(Job.objects.filter(
+            status=Job.DONE, created__lt=cutoff
+        ).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def claim(worker, now=None):
+    """Захватывает следующую задачу или возвращает ``None``."""
+    now = now or timezone.now()
+    candidates = available(now).order_by(
+        '-priority', 'run_after', 'pk'
+    ).values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        claimed = available(now).filter(pk=pk).update(
+            status=Job.RUNNING,
+            locked_until=now + visibility_timeout(),
+            locked_by=worker,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(task):
+    """Выполняет захваченную задачу и записывает результат."""
+    try:
+        registry[task.name](**json.loads(task.payload))
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Задача %s завершилась с ошибкой', task)
+        if task.attempts < task.max_attempts:
+            # Экспоненциальная задержка перед повтором
+            delay = getattr(settings, 'JOBS_RETRY_DELAY', 30)
+            Job.objects.filter(pk=task.pk, locked_by=task.locked_by).update(
+                status=Job.QUEUED,
+                run_after=timezone.now() + timedelta(
+                    seconds=delay * 2 ** (task.attempts - 1)
+                ),
+                locked_until=None,
+                last_error=error
+            )
+        else:
+            Job.objects.filter(pk=task.pk, locked_by=task.locked_by).update(
+                status=Job.FAILED, locked_until=None, last_error=error
+            )
+        return False
+    Job.objects.filter(pk=task.pk, locked_by=task.locked_by).update(
+        status=Job.DONE, locked_until=None
+    )
+    return True
+
+
+def worker_id():
+    return '{}:{}:{}'.format(
+        socket.gethostname(), os.getpid(), threading.get_ident()
+    )
+
+
+def run_pending(limit=None):
+    """Выполняет задачи, пока очередь не опустеет; возвращает их число."""
+    worker = worker_id()
+    expire()
+    done = 0
+    while limit is None or done < limit:
+        task = claim(worker)
+        if task is None:
+            # Очередь пуста - время прибраться
+            prune()
+            break
+        run(task)
+        done += 1
+    return done
+
+
+@job('send_mail')
+def send_mail_job(messages):
+    connection = get_connection(
+        getattr(settings, 'JOBS_EMAIL_BACKEND',
+                'django.core.mail.backends.smtp.EmailBackend')
+    )
+    emails = []
+    for data in messages:
+        alternatives = data.pop('alternatives')
+        attachments = data.pop('attachments', [])
+        email = EmailMultiAlternatives(**data)
+        for content, mimetype in alternatives:
+            email.attach_alternative(content, mimetype)
+        for filename, content, mimetype, binary in attachments:
+            if binary:
+                content = base64.b64decode(content)
+            email.attach(filename, content, mimetype)
+        emails.append(email)
+    connection.send_messages(emails)
+
+
+def serialize_attachment(attachment):
+    if not isinstance(attachment, tuple):
+        # Готовую MIME-часть в JSON не переложить без потерь
+        raise ValueError(
+            'Очередь писем принимает вложения только как '
+            '(имя, содержимое, тип), а не MIME-объекты'
+        )
+    filename, content, mimetype = attachment
+    binary = isinstance(content, bytes)
+    if binary:
+        content = base64.b64encode(content).decode()
+    return [filename, content, mimetype, binary]
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Вместо отправки письма в запросе ставит задачу ``send_mail``.
+    Реальный способ отправки задаёт ``JOBS_EMAIL_BACKEND``."""
+
+    def send_messages(self, email_messages):
+        messages = [{
+            'subject': message.subject,
+            'body': message.body,
+            'from_email': message.from_email,
+            'to': message.to,
+            'cc': message.cc,
+            'bcc': message.bcc,
+            'reply_to': message.reply_to,
+            'headers': message.extra_headers,
+            'alternatives': getattr(message, 'alternatives', []),
+            'attachments': [
+                serialize_attachment(attachment)
+                for attachment in message.attachments
+            ],
+        } for message in email_messages]
+        if messages:
+            enqueue('send_mail', priority=10, messages=messages)
+        return len(messages)
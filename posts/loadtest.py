@@ -0,0 +1,285 @@
+"""Нагрузочное тестирование на локальном сервере.
+
+Приложение запускается в этом же процессе на многопоточном WSGI-сервере
+Django, а виртуальные пользователи (потоки) выполняют случайную смесь
+действий: чтение ленты анонимом, вход, просмотр записи, лайк, комментарий
+и новую запись. Каждый HTTP-запрос учитывается под именем URL из
+``posts.urls``, по которым считаются пропускная способность, доля ошибок и
+перцентили задержки.
+
+Ожидания блокировок SQLite видны только изнутри сервера: к каждому новому
+соединению подключается обёртка выполнения запросов, считающая ошибки
+"database is locked" и записи, выполнявшиеся дольше порога. При
+``busy_timeout`` такая задержка почти всегда означает ожидание чужой
+транзакции.
+"""
+import http.client
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler,
+                                          get_internal_wsgi_application)
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+
+ACTIONS = ('feed', 'login', 'post', 'like', 'comment', 'new_post')
+DEFAULT_MIX = 'feed=50,post=25,login=5,like=8,comment=7,new_post=5'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLAC')
+
+
+def parse_mix(value):
+    """``'feed=50,post=20'`` -> ``{'feed': 50, 'post': 20}``."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ACTIONS:
+            raise ValueError(f'Неизвестное действие: {name}')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('Все веса нулевые')
+    return mix
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0
+    index = max(math.ceil(fraction * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.limited = defaultdict(int)
+
+    def add(self, name, seconds, status):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if status is None or status >= 500:
+                self.errors[name] += 1
+            elif status == 429:
+                self.limited[name] += 1
+
+    def summary(self, duration):
+        """Строки отчёта: имя, число запросов, запросов в секунду, доля
+        ошибок, число отказов 429, p50/p90/p99 и максимум в секундах."""
+        rows = []
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            rows.append({
+                'name': name,
+                'requests': len(values),
+                'rps': len(values) / duration,
+                'error_rate': self.errors[name] / len(values),
+                'limited': self.limited[name],
+                'p50': percentile(values, 0.5),
+                'p90': percentile(values, 0.9),
+                'p99': percentile(values, 0.99),
+                'max': values[-1],
+            })
+        return rows
+
+
+class LockMonitor:
+    """Обёртка ``execute_wrappers`` для соединений SQLite сервера."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.errors = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if 'locked' in str(error):
+                with self.lock:
+                    self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if (elapsed >= self.threshold
+                    and sql.lstrip()[:6].upper() in WRITE_STATEMENTS):
+                with self.lock:
+                    self.waits += 1
+                    self.wait_time += elapsed
+
+    def attach(self, sender, connection, **kwargs):
+        if connection.vendor == 'sqlite':
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.attach)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.attach)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LoadServer(ThreadedWSGIServer):
+    # Очередь соединений рассчитана на сотни одновременных клиентов
+    request_queue_size = 1024
+
+
+def start_server(host='127.0.0.1', port=0):
+    """Запускает приложение в фоновом потоке; возвращает сервер, адрес
+    которого в ``server.server_address``."""
+    server = LoadServer((host, port), QuietHandler)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def url_name(path):
+    try:
+        return resolve(urlsplit(path).path).url_name or path
+    except Resolver404:
+        return path
+
+
+class Client:
+    """Минимальный HTTP-клиент с cookie и CSRF-токеном. Перенаправлениям
+    не следует, чтобы каждый URL измерялся отдельно."""
+
+    def __init__(self, host, port, recorder, timeout=30):
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.timeout = timeout
+        self.cookies = {}
+        self.logged_in = False
+
+    def request(self, method, path, data=None, name=None, anonymous=False):
+        headers = {}
+        if self.cookies and not anonymous:
+            headers['Cookie'] = '; '.join(
+                f'{key}={value}' for key, value in self.cookies.items()
+            )
+        body = None
+        if data is not None:
+            data = dict(data,
+                        csrfmiddlewaretoken=self.cookies.get('csrftoken', ''))
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        status = None
+        start = time.perf_counter()
+        connection = http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout
+        )
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if not anonymous:
+                self.store_cookies(response.headers.get_all('Set-Cookie'))
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            connection.close()
+        self.recorder.add(name or url_name(path),
+                          time.perf_counter() - start, status)
+        return status
+
+    def store_cookies(self, headers):
+        for header in headers or ():
+            for key, morsel in SimpleCookie(header).items():
+                if morsel.value and morsel['max-age'] != '0':
+                    self.cookies[key] = morsel.value
+                else:
+                    self.cookies.pop(key, None)
+
+
+class VirtualUser:
+    def __init__(self, client, username, password, posts):
+        self.client = client
+        self.username = username
+        self.password = password
+        self.posts = posts
+
+    def run(self, mix, deadline, think):
+        actions, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            action = random.choices(actions, weights)[0]
+            if action not in ('feed', 'login', 'post') and \
+                    not self.client.logged_in:
+                self.login()
+            getattr(self, action)()
+            if think:
+                time.sleep(random.uniform(0, 2 * think))
+
+    def random_post(self):
+        return random.choice(self.posts) if self.posts else None
+
+    def feed(self):
+        page = random.randint(1, 3)
+        self.client.request('GET', f'/?page={page}', anonymous=True)
+
+    def login(self):
+        self.client.request('GET', '/auth/login/')
+        status = self.client.request('POST', '/auth/login/', {
+            'username': self.username, 'password': self.password,
+        })
+        self.client.logged_in = status == 302
+
+    def post(self):
+        post = self.random_post()
+        if post:
+            self.client.request('GET', '/{}/{}/'.format(*post))
+
+    def like(self):
+        post = self.random_post()
+        if post:
+            self.client.request('GET', '/{}/{}/like/'.format(*post))
+
+    def comment(self):
+        post = self.random_post()
+        if post:
+            self.client.request('POST', '/{}/{}/comment/'.format(*post), {
+                'text': f'Нагрузочный комментарий {random.random()}',
+            })
+
+    def new_post(self):
+        self.client.request('POST', '/new/', {
+            'text': f'Нагрузочная запись {random.random()}',
+        })
+
+
+def run(host, port, accounts, posts, mix, seconds, think=0):
+    """Гоняет ``len(accounts)`` виртуальных пользователей ``seconds``
+    секунд; ``accounts`` - пары (имя, пароль), ``posts`` - пары
+    (автор, id). Возвращает ``Recorder``."""
+    recorder = Recorder()
+    deadline = time.monotonic() + seconds
+    threads = []
+    for username, password in accounts:
+        user = VirtualUser(
+            Client(host, port, recorder), username, password, posts
+        )
+        threads.append(threading.Thread(
+            target=user.run, args=(mix, deadline, think), daemon=True
+        ))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts import text
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет отрисованный HTML текста и упоминания у ' \
+           'существующих записей и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перерисовать все тексты, а не только незаполненные'
+        )
+
+    def handle(self, *args, **options):
+        for model, title in ((Post, 'записей'), (Comment, 'комментариев')):
+            total = text.backfill(
+                model,
+                batch_size=options['batch_size'],
+                only_missing=not options['all']
+            )
+            self.stdout.write(f'Обработано {title}: {total}')
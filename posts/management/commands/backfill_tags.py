@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import tags
+
+
+class Command(BaseCommand):
+    help = 'Размечает хэштеги существующих записей. Ссылки на теги в ' \
+           'тексте обновляет команда backfill_post_html --all'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--start-after', type=int, default=0,
+            help='Продолжить с записи, следующей за этим ключом'
+        )
+
+    def handle(self, *args, **options):
+        total, last_pk = tags.backfill(
+            options['batch_size'], options['start_after']
+        )
+        self.stdout.write(
+            f'Обработано записей: {total}, последний ключ: {last_pk}'
+        )
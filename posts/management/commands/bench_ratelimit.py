@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+
+from yatube.ratelimit import RateLimitMiddleware
+
+# Счётчики замера живут в отдельном кэше процесса и не трогают кэш
+# RATELIMIT_CACHE из настроек
+BENCH_CACHE = 'ratelimit_bench'
+
+
+class Command(BaseCommand):
+    help = 'Измеряет накладные расходы ограничения частоты на запрос'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--clients', type=int, default=1000)
+
+    def measure(self, requests, rate):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        resolver_match = resolve('/new/')
+        factory = RequestFactory()
+        prepared = []
+        for i in range(requests):
+            request = factory.post(
+                '/new/', REMOTE_ADDR=f'10.0.{i % 250}.{i % self.clients}'
+            )
+            request.user = AnonymousUser()
+            request.resolver_match = resolver_match
+            prepared.append(request)
+        caches = dict(settings.CACHES, **{BENCH_CACHE: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': BENCH_CACHE,
+        }})
+        with override_settings(CACHES=caches, RATELIMIT_CACHE=BENCH_CACHE,
+                               RATELIMITS={'new_post': rate}):
+            start = time.perf_counter()
+            for request in prepared:
+                middleware.process_view(request, None, (), {})
+            return (time.perf_counter() - start) / requests
+
+    def handle(self, *args, **options):
+        self.clients = options['clients']
+        baseline = self.measure(options['requests'], None)
+        limited = self.measure(options['requests'], '1000/s')
+        self.stdout.write(
+            f'Без ограничения: {baseline * 1e6:.2f} мкс/запрос, '
+            f'с ограничением: {limited * 1e6:.2f} мкс/запрос, '
+            f'накладные расходы: {(limited - baseline) * 1e6:.2f} мкс'
+        )
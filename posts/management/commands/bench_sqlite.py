@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from yatube.sqlite import apply_pragmas, get_pragmas
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность SQLite под конкурентной ' \
+           'нагрузкой со стандартными и настроенными параметрами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.1,
+            help='Доля операций записи'
+        )
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def prepare(self, path, rows):
+        db = sqlite3.connect(path)
+        db.execute(
+            'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, '
+            'visits INTEGER NOT NULL DEFAULT 0)'
+        )
+        db.executemany(
+            'INSERT INTO post (text) VALUES (?)',
+            (('x' * 200,) for _ in range(rows))
+        )
+        db.commit()
+        db.close()
+
+    def run(self, path, tuned, options):
+        """Каждый поток выполняет вперемешку чтения страницы ленты и
+        инкременты счётчика. Без настройки соединение открывается на
+        каждую операцию, как при CONN_MAX_AGE = 0."""
+        stop = time.monotonic() + options['seconds']
+        stats = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        every = max(int(1 / options['write_ratio']), 1) if \
+            options['write_ratio'] else 0
+
+        def connect():
+            db = sqlite3.connect(path, check_same_thread=False)
+            if tuned:
+                apply_pragmas(db.cursor(), get_pragmas())
+            return db
+
+        def worker(seed):
+            reads = writes = locked = 0
+            db = connect() if tuned else None
+            i = seed
+            while time.monotonic() < stop:
+                i += 1
+                conn = db or connect()
+                try:
+                    if every and i % every == 0:
+                        conn.execute(
+                            'UPDATE post SET visits = visits + 1 '
+                            'WHERE id = ?', (i % options['rows'] + 1,)
+                        )
+                        conn.commit()
+                        writes += 1
+                    else:
+                        conn.execute(
+                            'SELECT id, text, visits FROM post '
+                            'ORDER BY id DESC LIMIT 10 OFFSET ?',
+                            (i % 100 * 10,)
+                        ).fetchall()
+                        reads += 1
+                except sqlite3.OperationalError:
+                    conn.rollback()
+                    locked += 1
+                finally:
+                    if db is None:
+                        conn.close()
+            if db is not None:
+                db.close()
+            with lock:
+                stats['reads'] += reads
+                stats['writes'] += writes
+                stats['locked'] += locked
+
+        threads = [
+            threading.Thread(target=worker, args=(n * 7919,))
+            for n in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def handle(self, *args, **options):
+        for tuned in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.prepare(path, options['rows'])
+                stats = self.run(path, tuned, options)
+            seconds = options['seconds']
+            self.stdout.write(
+                '{}: чтений {:.0f}/с, записей {:.0f}/с, '
+                'ошибок блокировки {}'.format(
+                    'с настройкой' if tuned else 'без настройки',
+                    stats['reads'] / seconds,
+                    stats['writes'] / seconds,
+                    stats['locked']
+                )
+            )
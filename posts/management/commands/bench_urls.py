@@ -0,0 +1,57 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from posts import urlbuilder
+
+# Адреса, которые строит карточка записи
+CARD_ROUTES = (
+    ('profile', ('leo',)),
+    ('group', ('cats',)),
+    ('post', ('leo', 42)),
+    ('add_comment', ('leo', 42)),
+    ('post_edit', ('leo', 42)),
+    ('post_delete', ('leo', 42)),
+    ('new_like', ('leo', 42)),
+    ('dislike', ('leo', 42)),
+)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость reverse() и posts.urlbuilder на адресах ' \
+           'карточки записи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000)
+
+    def measure(self, func, name, args, number):
+        return min(timeit.repeat(
+            lambda: func(name, args), number=number, repeat=3
+        )) / number * 1e6
+
+    def handle(self, *args, **options):
+        number = options['number']
+        total_reverse = total_fast = 0
+        for name, route_args in CARD_ROUTES:
+            if reverse(name, args=route_args) != urlbuilder.build(
+                    name, *route_args):
+                self.stderr.write(f'{name}: адреса не совпадают')
+            slow = self.measure(
+                lambda name, args: reverse(name, args=args), name,
+                route_args, number
+            )
+            fast = self.measure(
+                lambda name, args: urlbuilder.build(name, *args), name,
+                route_args, number
+            )
+            total_reverse += slow
+            total_fast += fast
+            self.stdout.write(
+                f'{name}: reverse() {slow:.2f} мкс, '
+                f'urlbuilder {fast:.2f} мкс, в {slow / fast:.1f} раза быстрее'
+            )
+        self.stdout.write(
+            f'Карточка записи: reverse() {total_reverse:.1f} мкс, '
+            f'urlbuilder {total_fast:.1f} мкс'
+        )
@@ -0,0 +1,142 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from yatube.sqlite import apply_pragmas, get_pragmas
+
+COLUMNS = ('text', 'text_html', 'excerpt_html', 'pub_date', 'author_id',
+           'group_id', 'image', 'visits', 'deleted_at')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость учёта просмотров популярной записи: ' \
+           'сохранение всей строки, как post.save(), UPDATE ... SET ' \
+           'visits = visits + 1 и частями счётчика'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--posts', type=int, default=1,
+                            help='Сколько записей просматривается')
+        parser.add_argument('--shards', type=int, default=8)
+
+    def prepare(self, path, posts):
+        db = sqlite3.connect(path)
+        db.execute(
+            'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, '
+            'text_html TEXT, excerpt_html TEXT, pub_date TEXT, '
+            'author_id INTEGER, group_id INTEGER, image TEXT, '
+            'visits INTEGER NOT NULL DEFAULT 0, deleted_at TEXT)'
+        )
+        db.execute(
+            'CREATE TABLE shard (id INTEGER PRIMARY KEY, post_id INTEGER, '
+            'shard INTEGER, count INTEGER NOT NULL DEFAULT 0, '
+            'UNIQUE (post_id, shard))'
+        )
+        db.executemany(
+            'INSERT INTO post (text, text_html, excerpt_html, pub_date, '
+            'author_id) VALUES (?, ?, ?, ?, 1)',
+            (('x' * 2000, '<p>' + 'x' * 2000 + '</p>', 'x' * 300,
+              '2026-01-01 00:00:00') for _ in range(posts))
+        )
+        db.commit()
+        db.close()
+
+    def save_visit(self, db, post_id, shards):
+        """Как ``post.visits += 1; post.save()``: прочитать строку и
+        записать все поля обратно."""
+        row = db.execute(
+            'SELECT {} FROM post WHERE id = ?'.format(', '.join(COLUMNS)),
+            (post_id,)
+        ).fetchone()
+        values = list(row)
+        values[COLUMNS.index('visits')] += 1
+        db.execute(
+            'UPDATE post SET {} WHERE id = ?'.format(
+                ', '.join(f'{column} = ?' for column in COLUMNS)
+            ),
+            values + [post_id]
+        )
+        db.commit()
+
+    def update_visit(self, db, post_id, shards):
+        """Как ``update(visits=F('visits') + 1)``: одна запись без чтения,
+        но все просмотры - в одну строку."""
+        db.execute('UPDATE post SET visits = visits + 1 WHERE id = ?',
+                   (post_id,))
+        db.commit()
+
+    def shard_visit(self, db, post_id, shards):
+        shard = random.randrange(shards)
+        cursor = db.execute(
+            'UPDATE shard SET count = count + 1 '
+            'WHERE post_id = ? AND shard = ?', (post_id, shard)
+        )
+        if not cursor.rowcount:
+            db.execute(
+                'INSERT INTO shard (post_id, shard, count) VALUES (?, ?, 1) '
+                'ON CONFLICT (post_id, shard) DO UPDATE '
+                'SET count = count + 1', (post_id, shard)
+            )
+        db.commit()
+
+    def counted(self, path):
+        db = sqlite3.connect(path)
+        total = db.execute('SELECT SUM(visits) FROM post').fetchone()[0]
+        total += db.execute(
+            'SELECT COALESCE(SUM(count), 0) FROM shard'
+        ).fetchone()[0]
+        db.close()
+        return total
+
+    def run(self, path, visit, options):
+        stop = time.monotonic() + options['seconds']
+        stats = {'visits': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def worker():
+            db = sqlite3.connect(path, check_same_thread=False)
+            apply_pragmas(db.cursor(), get_pragmas())
+            visits = locked = 0
+            while time.monotonic() < stop:
+                post_id = random.randint(1, options['posts'])
+                try:
+                    visit(db, post_id, options['shards'])
+                    visits += 1
+                except sqlite3.OperationalError:
+                    db.rollback()
+                    locked += 1
+            db.close()
+            with lock:
+                stats['visits'] += visits
+                stats['locked'] += locked
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
+
+    def handle(self, *args, **options):
+        for title, visit in (('post.save()', self.save_visit),
+                             ('visits = visits + 1', self.update_visit),
+                             ('части счётчика', self.shard_visit)):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self.prepare(path, options['posts'])
+                stats = self.run(path, visit, options)
+                counted = self.counted(path)
+            self.stdout.write(
+                '{}: {:.0f} просмотров/с, потеряно {}, ошибок блокировки '
+                '{}'.format(
+                    title, stats['visits'] / options['seconds'],
+                    stats['visits'] - counted, stats['locked']
+                )
+            )
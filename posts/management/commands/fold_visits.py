@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import visits
+
+
+class Command(BaseCommand):
+    help = 'Переносит накопленные просмотры из частей счётчика в ' \
+           'Post.visits. Запускайте по расписанию, например раз в минуту'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        folded = visits.fold(batch_size=options['batch_size'])
+        self.stdout.write(f'Обновлено записей: {folded}')
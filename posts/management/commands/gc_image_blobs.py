@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts import blobs
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы картинок, на которые не ссылается ни одна запись'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='Не трогать файлы, потерявшие ссылки менее указанного '
+                 'числа секунд назад'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Сначала пересчитать счётчики ссылок по записям'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            total = blobs.rebuild()
+            self.stdout.write(f'Файлов со ссылками: {total}')
+        removed = 0
+        while True:
+            batch = blobs.collect(
+                timedelta(seconds=options['grace']), options['batch_size']
+            )
+            removed += batch
+            if batch < options['batch_size']:
+                break
+        self.stdout.write(f'Удалено файлов: {removed}')
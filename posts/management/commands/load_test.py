@@ -0,0 +1,128 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from posts import loadtest
+from posts.models import Post, User
+
+USERNAME_PREFIX = 'loadtest_'
+PASSWORD = 'loadtest-password'
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест: запускает приложение на локальном сервере и ' \
+           'прогоняет смесь запросов виртуальных пользователей. Пишет в ' \
+           'настроенную базу данных, не запускайте на рабочей базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Число одновременных пользователей')
+        parser.add_argument('--seconds', type=float, default=30)
+        parser.add_argument(
+            '--mix', default=loadtest.DEFAULT_MIX,
+            help='Веса действий: ' + ', '.join(loadtest.ACTIONS)
+        )
+        parser.add_argument('--think', type=float, default=0,
+                            help='Средняя пауза между действиями, секунд')
+        parser.add_argument(
+            '--lock-threshold', type=float, default=50,
+            help='Запись дольше стольких миллисекунд считается ожиданием '
+                 'блокировки'
+        )
+        parser.add_argument('--no-ratelimit', action='store_true',
+                            help='Отключить RATELIMITS на время теста')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Не удалять тестовых пользователей и '
+                                 'созданные ими записи')
+
+    def prepare_accounts(self, count):
+        names = [f'{USERNAME_PREFIX}{n}' for n in range(count)]
+        existing = set(User.objects.filter(
+            username__in=names).values_list('username', flat=True))
+        # Хэш пароля считается один раз, а не для каждого пользователя
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(username=name, password=password)
+            for name in names if name not in existing
+        )
+        User.objects.filter(username__in=names).update(password=password)
+        return [(name, PASSWORD) for name in names]
+
+    def sample_posts(self, accounts, size=1000, seed=100):
+        """Записи для просмотров, лайков и комментариев. В пустой базе
+        создаются записи от имени тестовых пользователей."""
+        posts = Post.objects.values_list('author__username', 'pk')
+        if not posts.exists():
+            authors = {user.username: user for user in User.objects.filter(
+                username__in=[name for name, _ in accounts])}
+            for n in range(seed):
+                Post.objects.create(
+                    text=f'Запись для нагрузочного теста {n}',
+                    author=authors[accounts[n % len(accounts)][0]]
+                )
+        return list(posts[:size])
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(error)
+        accounts = self.prepare_accounts(options['users'])
+        posts = self.sample_posts(accounts)
+        overrides = {'DEBUG': False}
+        if options['no_ratelimit']:
+            overrides['RATELIMITS'] = {}
+        monitor = loadtest.LockMonitor(options['lock_threshold'] / 1000)
+        try:
+            with override_settings(**overrides), monitor:
+                server = loadtest.start_server()
+                host, port = server.server_address[:2]
+                started = time.monotonic()
+                recorder = loadtest.run(
+                    host, port, accounts, posts, mix, options['seconds'],
+                    options['think']
+                )
+                duration = time.monotonic() - started
+                server.shutdown()
+                server.server_close()
+        finally:
+            if not options['keep_data']:
+                # У записей автор обнуляется, а не удаляется каскадом
+                Post.all_objects.filter(
+                    author__username__startswith=USERNAME_PREFIX
+                ).delete()
+                User.objects.filter(
+                    username__startswith=USERNAME_PREFIX
+                ).delete()
+        self.report(recorder.summary(duration), monitor, duration)
+
+    def report(self, rows, monitor, duration):
+        self.stdout.write('{:<20} {:>8} {:>8} {:>7} {:>6} {:>8} {:>8} '
+                          '{:>8} {:>8}'.format(
+                              'URL', 'запросов', 'в сек', 'ошибок', '429',
+                              'p50 мс', 'p90 мс', 'p99 мс', 'макс мс'))
+        total = 0
+        for row in rows:
+            total += row['requests']
+            self.stdout.write(
+                '{name:<20} {requests:>8} {rps:>8.1f} {errors:>6.1%} '
+                '{limited:>6} {p50:>8.1f} {p90:>8.1f} {p99:>8.1f} '
+                '{max:>8.1f}'.format(
+                    name=row['name'], requests=row['requests'],
+                    rps=row['rps'], errors=row['error_rate'],
+                    limited=row['limited'], p50=row['p50'] * 1000,
+                    p90=row['p90'] * 1000, p99=row['p99'] * 1000,
+                    max=row['max'] * 1000
+                )
+            )
+        self.stdout.write(
+            f'Всего: {total} запросов за {duration:.1f} с '
+            f'({total / duration:.1f}/с)'
+        )
+        self.stdout.write(
+            f'SQLite: ожиданий блокировки {monitor.waits} '
+            f'({monitor.wait_time:.2f} с), ошибок "database is locked" '
+            f'{monitor.errors}'
+        )
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from posts.models import MemoryProfile
+
+
+def kib(size):
+    return f'{size / 1024:.1f} КиБ'
+
+
+class Command(BaseCommand):
+    help = 'Профилирует память запросов к переданным адресам через ' \
+           'tracemalloc и печатает накопленный отчёт по представлениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*',
+                            help='Адреса, например / или /group/cats/')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--user', help='Выполнять запросы от имени '
+                                           'этого пользователя')
+        parser.add_argument('--reset', action='store_true',
+                            help='Удалить накопленные замеры')
+        parser.add_argument('--top', type=int, default=5,
+                            help='Сколько мест выделения показать')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            MemoryProfile.objects.all().delete()
+        if options['urls']:
+            self.profile(options)
+        self.report(options['top'])
+
+    def profile(self, options):
+        # Без DEBUG не копятся connection.queries, а кэш страниц не
+        # подменяет ответы представлений
+        with override_settings(MEMORY_PROFILE=True, MEMORY_PROFILE_SAMPLE=1,
+                               DEBUG=False, PAGE_CACHE_VIEWS=(),
+                               ALLOWED_HOSTS=['testserver']):
+            client = Client()
+            if options['user']:
+                try:
+                    client.force_login(
+                        User.objects.get(username=options['user'])
+                    )
+                except User.DoesNotExist:
+                    raise CommandError('Пользователь не найден')
+            for url in options['urls']:
+                for _ in range(options['repeat']):
+                    client.get(url)
+
+    def report(self, top):
+        for profile in MemoryProfile.objects.order_by('-peak_max'):
+            self.stdout.write(
+                f'{profile.view}: запросов {profile.requests}, прирост '
+                f'{kib(profile.net_avg)}, пик {kib(profile.peak_avg)} '
+                f'(максимум {kib(profile.peak_max)})'
+            )
+            for allocation in profile.allocations.order_by(
+                    '-size_total')[:top]:
+                self.stdout.write(
+                    f'    {allocation.site}: {kib(allocation.size_total)} '
+                    f'за {allocation.requests} запр.'
+                )
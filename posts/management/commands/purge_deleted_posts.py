@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.purge import purge_deleted_posts
+
+
+class Command(BaseCommand):
+    help = 'Окончательно удаляет скрытые записи вместе с комментариями ' \
+           'и лайками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--grace', type=int, default=0,
+            help='Удалять записи, скрытые не менее указанного числа '
+                 'секунд назад'
+        )
+
+    def handle(self, *args, **options):
+        purged = purge_deleted_posts(
+            batch_size=options['batch_size'],
+            grace=timedelta(seconds=options['grace'])
+        )
+        self.stdout.write(f'Удалено записей: {purged}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает помесячную статистику архивов авторов и сообществ'
+
+    def handle(self, *args, **options):
+        total = archive.rebuild()
+        self.stdout.write(f'Месяцев в архиве: {total}')
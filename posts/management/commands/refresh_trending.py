@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Удаляет затухшие рейтинги и обновляет кэш популярного'
+
+    def handle(self, *args, **options):
+        kept, removed = trending.refresh()
+        self.stdout.write(
+            f'Рейтингов: {kept}, удалено затухших: {removed}'
+        )
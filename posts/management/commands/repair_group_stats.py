@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import group_stats
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает количество записей и дату последней записи ' \
+           'для каталога сообществ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(Group.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            group_stats.refresh(ids[start:start + batch_size])
+        self.stdout.write(f'Пересчитано сообществ: {len(ids)}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import analytics
+
+
+class Command(BaseCommand):
+    help = 'Переносит новые просмотры, лайки и комментарии в почасовую и ' \
+           'дневную статистику. Запускайте по расписанию'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        result = analytics.rollup(batch_size=options['batch_size'])
+        self.stdout.write(
+            'Записей с просмотрами: {views}, лайков: {likes}, '
+            'комментариев: {comments}'.format(**result)
+        )
@@ -0,0 +1,81 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from posts import jobs
+
+
+def work(stop, poll, once):
+    """Цикл одного обработчика: выполняет задачи, а при пустой очереди
+    ждёт ``poll`` секунд."""
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            if not jobs.run_pending(limit=100):
+                if once:
+                    return
+                stop.wait(poll)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает обработчик фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Количество параллельных обработчиков'
+        )
+        parser.add_argument(
+            '--mode', choices=('thread', 'process'), default='thread',
+            help='Обработчики - потоки или процессы'
+        )
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='Пауза при пустой очереди, секунд'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить накопившиеся задачи и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'process':
+            # Соединения с базой нельзя делить между процессами
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            workers = [
+                context.Process(
+                    target=work,
+                    args=(stop, options['poll'], options['once'])
+                )
+                for _ in range(options['concurrency'])
+            ]
+        else:
+            stop = threading.Event()
+            workers = [
+                threading.Thread(
+                    target=work,
+                    args=(stop, options['poll'], options['once'])
+                )
+                for _ in range(options['concurrency'])
+            ]
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        for worker in workers:
+            worker.start()
+        self.stdout.write(
+            f'Запущено обработчиков: {len(workers)} ({options["mode"]})'
+        )
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+        for worker in workers:
+            worker.join()
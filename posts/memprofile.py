@@ -0,0 +1,131 @@
+"""Профилирование памяти запросов через tracemalloc.
+
+Включается настройкой ``MEMORY_PROFILE``; без неё middleware отключает
+себя при запуске и ничего не стоит. Для каждого профилируемого запроса
+замеряются прирост отслеживаемой памяти и пик относительно начала запроса,
+а сравнение снимков до и после показывает строки кода, где осталась
+выделенная память. Результаты копятся по имени представления в
+``MemoryProfile`` и ``MemoryAllocation`` и смотрятся в админке.
+
+tracemalloc считает память всего процесса, поэтому профилируемые запросы
+выполняются строго по одному. Это заметно замедляет многопоточный сервер:
+включайте профилирование на одном экземпляре или долей
+``MEMORY_PROFILE_SAMPLE``.
+"""
+import os
+import random
+import threading
+import tracemalloc
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import MemoryAllocation, MemoryProfile
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, __file__),
+)
+
+_lock = threading.Lock()
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(getattr(settings, 'MEMORY_PROFILE_FRAMES', 1))
+
+
+def site_name(frame):
+    filename = frame.filename
+    base = settings.BASE_DIR + os.sep
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    else:
+        filename = filename.rpartition('site-packages' + os.sep)[2]
+    return f'{filename}:{frame.lineno}'[-300:]
+
+
+def measure(func, sites=10):
+    """Вызывает ``func`` и возвращает (результат, прирост памяти, пик,
+    места выделения). Места - до ``sites`` троек (строка кода, байт,
+    блоков) с наибольшим приростом."""
+    with _lock:
+        before = tracemalloc.take_snapshot() if sites else None
+        tracemalloc.reset_peak()
+        start_size = tracemalloc.get_traced_memory()[0]
+        result = func()
+        size, peak = tracemalloc.get_traced_memory()
+        top = []
+        if before is not None:
+            after = tracemalloc.take_snapshot().filter_traces(
+                SNAPSHOT_FILTERS
+            )
+            diff = after.compare_to(
+                before.filter_traces(SNAPSHOT_FILTERS), 'lineno'
+            )
+            top = [
+                (site_name(stat.traceback[0]), stat.size_diff,
+                 stat.count_diff)
+                for stat in diff[:sites] if stat.size_diff > 0
+            ]
+    return result, size - start_size, peak - start_size, top
+
+
+def _add(model, lookup, counters, changes=None, **create):
+    """Прибавляет ``counters`` к строке ``lookup``, создавая её при
+    необходимости."""
+    changes = dict(changes or {}, **{
+        name: F(name) + value for name, value in counters.items()
+    })
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **counters, **create)
+    except IntegrityError:
+        # Строку успели создать параллельно
+        model.objects.filter(**lookup).update(**changes)
+
+
+def record(view, net, peak, sites=()):
+    _add(
+        MemoryProfile, {'view': view},
+        {'requests': 1, 'net_total': net, 'peak_total': peak},
+        peak_max=peak, changes={'peak_max': Greatest('peak_max', peak)}
+    )
+    if not sites:
+        return
+    profile_id = MemoryProfile.objects.values_list('pk', flat=True).get(
+        view=view
+    )
+    for site, size, count in sites:
+        _add(
+            MemoryAllocation, {'profile_id': profile_id, 'site': site},
+            {'size_total': size, 'count_total': count, 'requests': 1}
+        )
+
+
+class MemoryProfileMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'MEMORY_PROFILE', False):
+            raise MiddlewareNotUsed
+        start()
+        self.get_response = get_response
+        self.sample = getattr(settings, 'MEMORY_PROFILE_SAMPLE', 1.0)
+        self.sites = getattr(settings, 'MEMORY_PROFILE_SITES', 10)
+
+    def __call__(self, request):
+        if random.random() >= self.sample:
+            return self.get_response(request)
+        response, net, peak, sites = measure(
+            lambda: self.get_response(request), self.sites
+        )
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            record(match.view_name, net, peak, sites)
+        return response
@@ -0,0 +1,68 @@
+"""Упоминания ``@username`` в записях и комментариях.
+
+Имена разбираются и разрешаются при отрисовке текста (posts.text), а здесь
+по результату пересобираются строки ``Mention``: сигналом после
+сохранения и командой ``backfill_post_html`` для существующих текстов.
+
+Ссылка на профиль в готовом HTML зависит от имени и активности
+пользователя, поэтому при переименовании, отключении, включении и удалении
+пользователя тексты с его упоминаниями отрисовываются заново фоновой
+задачей ``rerender_mentions``. При регистрации этого не делается, чтобы
+не просматривать все тексты на каждую регистрацию: упоминания имени,
+написанные до регистрации, станут ссылками после
+``backfill_post_html --all``.
+"""
+from django.db.models import Q
+
+from .models import Comment, Mention, Post
+
+
+def sync(objects):
+    """Приводит упоминания записей или комментариев ``objects`` (одной
+    модели, уже отрисованных) в соответствие с их текстом."""
+    if not objects:
+        return
+    is_comment = isinstance(objects[0], Comment)
+    owner = 'comment_id' if is_comment else 'post_id'
+    by_pk = {obj.pk: obj for obj in objects}
+    rows = Mention.objects.filter(**{f'{owner}__in': by_pk})
+    if not is_comment:
+        rows = rows.filter(comment__isnull=True)
+    current = set(rows.values_list(owner, 'user_id'))
+    target = {
+        (obj.pk, user_id)
+        for obj in objects for user_id in obj._mentioned.values()
+    }
+    stale = current - target
+    if stale:
+        condition = Q()
+        for pk, user_id in stale:
+            condition |= Q(**{owner: pk, 'user_id': user_id})
+        rows.filter(condition).delete()
+    Mention.objects.bulk_create([
+        Mention(
+            user_id=user_id,
+            post_id=by_pk[pk].post_id if is_comment else pk,
+            comment_id=pk if is_comment else None,
+        )
+        for pk, user_id in target - current
+    ], ignore_conflicts=True)
+
+
+def user_changed(username, user_id=None):
+    """Перерисовывает записи и комментарии, где упомянут пользователь
+    ``user_id``: по строкам ``Mention`` (ссылки на старое имя) и по тексту
+    с ``@username`` (ещё не ставшие ссылками). Поиск по тексту
+    просматривает всю таблицу, поэтому вызывается из фоновой задачи."""
+    from .text import backfill
+
+    total = 0
+    for model, owner, in_post in ((Post, 'post_id', True),
+                                  (Comment, 'comment_id', False)):
+        condition = Q(text__contains=f'@{username}')
+        if user_id is not None:
+            condition |= Q(pk__in=Mention.objects.filter(
+                user_id=user_id, comment__isnull=in_post
+            ).values(owner))
+        total += backfill(model, only_missing=False, condition=condition)
+    return total
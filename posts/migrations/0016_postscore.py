@@ -0,0 +1,25 @@
+# Generated by Django 2.2.13 on 2026-10-19 19:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_auto_20200909_2031'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('score', models.FloatField(db_index=True, default=0, verbose_name='Рейтинг')),
+                ('updated', models.DateTimeField(verbose_name='Момент последнего пересчёта рейтинга')),
+            ],
+            options={
+                'ordering': ('-score',),
+            },
+        ),
+    ]
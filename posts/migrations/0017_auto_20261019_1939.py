@@ -0,0 +1,42 @@
+# Generated by Django 2.2.13 on 2026-10-19 19:39
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.filter(group=OuterRef('pk')).order_by().values(
+        'group'
+    )
+    Group.objects.update(
+        post_count=Coalesce(
+            Subquery(posts.annotate(total=Count('pk')).values('total')), 0
+        ),
+        last_post_at=Subquery(
+            posts.annotate(last=Max('pub_date')).values('last')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_postscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Дата последней записи'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество записей'),
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
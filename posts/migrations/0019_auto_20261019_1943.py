@@ -0,0 +1,57 @@
+# Generated by Django 2.2.13 on 2026-10-19 19:43
+
+from django.db import migrations, models
+from django.utils.html import escape
+from django.utils.text import Truncator, normalize_newlines
+
+# Копия posts.text на момент миграции: поздние изменения отрисовки
+# (ссылки на теги и упоминания) сюда попадать не должны
+EXCERPT_LENGTH = 300
+
+
+def render_html(text):
+    return normalize_newlines(escape(text)).replace('\n', '<br>')
+
+
+def render_excerpt(text):
+    if len(text) <= EXCERPT_LENGTH:
+        return ''
+    return render_html(Truncator(text).chars(EXCERPT_LENGTH))
+
+
+def render_existing(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    last_pk = 0
+    while True:
+        posts = list(
+            Post.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'text')[:500]
+        )
+        if not posts:
+            return
+        for post in posts:
+            post.text_html = render_html(post.text)
+            post.excerpt_html = render_excerpt(post.text)
+        Post.objects.bulk_update(posts, ['text_html', 'excerpt_html'])
+        last_pk = posts[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
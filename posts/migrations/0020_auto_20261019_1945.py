@@ -0,0 +1,27 @@
+# Generated by Django 2.2.13 on 2026-10-19 19:45
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_auto_20261019_1943'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Изображение к посту', null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Изображение поста'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.13 on 2026-10-19 19:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_archivemonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemoryProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(max_length=200, unique=True, verbose_name='Представление')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='Запросов')),
+                ('net_total', models.BigIntegerField(default=0, help_text='Сумма по всем запросам', verbose_name='Прирост памяти, байт')),
+                ('peak_total', models.BigIntegerField(default=0, verbose_name='Сумма пиков, байт')),
+                ('peak_max', models.BigIntegerField(default=0, verbose_name='Максимальный пик, байт')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'профиль памяти',
+                'verbose_name_plural': 'профили памяти',
+            },
+        ),
+        migrations.CreateModel(
+            name='MemoryAllocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=300, verbose_name='Место выделения')),
+                ('size_total', models.BigIntegerField(default=0, verbose_name='Байт')),
+                ('count_total', models.BigIntegerField(default=0, verbose_name='Блоков')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='Запросов')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='posts.MemoryProfile', verbose_name='Профиль')),
+            ],
+            options={
+                'verbose_name': 'место выделения памяти',
+                'verbose_name_plural': 'места выделения памяти',
+                'unique_together': {('profile', 'site')},
+            },
+        ),
+    ]
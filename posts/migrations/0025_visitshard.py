@@ -0,0 +1,26 @@
+# Generated by Django 2.2.13 on 2026-10-19 20:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_memoryprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Номер части')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Просмотров')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visit_shards', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'unique_together': {('post', 'shard')},
+            },
+        ),
+    ]
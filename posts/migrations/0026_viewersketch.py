@@ -0,0 +1,26 @@
+# Generated by Django 2.2.13 on 2026-10-19 20:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_visitshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewerSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('sketch', models.BinaryField(verbose_name='Скетч')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='viewer_sketches', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'unique_together': {('post', 'day')},
+            },
+        ),
+    ]
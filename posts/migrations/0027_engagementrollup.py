@@ -0,0 +1,45 @@
+# Generated by Django 2.2.13 on 2026-10-19 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0026_viewersketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EngagementRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'День')], max_length=4, verbose_name='Период')),
+                ('start', models.DateTimeField(verbose_name='Начало периода')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('likes', models.PositiveIntegerField(default=0, verbose_name='Лайки')),
+                ('comments', models.PositiveIntegerField(default=0, verbose_name='Комментарии')),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='posts.Post', verbose_name='Пост')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='engagementrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(post__isnull=True), fields=('author', 'period', 'start'), name='rollup_author_period'),
+        ),
+        migrations.AddConstraint(
+            model_name='engagementrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(author__isnull=True), fields=('post', 'period', 'start'), name='rollup_post_period'),
+        ),
+    ]
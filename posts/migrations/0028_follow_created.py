@@ -0,0 +1,27 @@
+# Generated by Django 2.2.13 on 2026-10-19 20:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_engagementrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата подписки'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'created', 'id'], name='posts_follo_author__b63855_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', 'created', 'id'], name='posts_follo_user_id_8d4f7d_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+import datetime
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def fill_archive(apps, schema_editor):
+    """Пересобирает помесячные архивы по существующим записям. Копия
+    posts.archive.rebuild на исторических моделях. Таблица могла быть
+    частично заполнена сигналами после 0023, поэтому собирается заново."""
+    Post = apps.get_model('posts', 'Post')
+    ArchiveMonth = apps.get_model('posts', 'ArchiveMonth')
+    ArchiveMonth.objects.all().delete()
+    rows = []
+    for field in ('author', 'group'):
+        months = Post.objects.filter(
+            deleted_at__isnull=True, **{f'{field}__isnull': False}
+        ).annotate(
+            month=TruncMonth('pub_date')
+        ).order_by().values(field, 'month').annotate(total=Count('pk'))
+        for row in months:
+            month = row['month']
+            if isinstance(month, datetime.datetime):
+                month = month.date()
+            rows.append(ArchiveMonth(
+                month=month, post_count=row['total'],
+                **{f'{field}_id': row[field]}
+            ))
+    ArchiveMonth.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0030_mention'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+import struct
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия разбора и объединения скетчей posts.hll на момент миграции
+SPARSE = 0
+DENSE = 1
+HEADER = struct.Struct('>BB')
+REGISTER_BITS = 6
+REGISTER_MASK = (1 << REGISTER_BITS) - 1
+
+
+def read_registers(data):
+    """Точность и ненулевые регистры скетча."""
+    kind, precision = HEADER.unpack_from(data)
+    body = bytes(data[HEADER.size:])
+    if kind == SPARSE:
+        return precision, {
+            entry >> REGISTER_BITS: entry & REGISTER_MASK
+            for (entry,) in struct.iter_unpack('>I', body)
+        }
+    if kind == DENSE:
+        return precision, {
+            index: rank for index, rank in enumerate(body) if rank
+        }
+    raise ValueError('Неизвестный формат скетча')
+
+
+def write_registers(precision, registers):
+    m = 1 << precision
+    # Как в HyperLogLog: разреженная форма, пока она меньше плотной
+    if len(registers) * 4 < m:
+        return HEADER.pack(SPARSE, precision) + b''.join(
+            struct.pack('>I', index << REGISTER_BITS | rank)
+            for index, rank in sorted(registers.items())
+        )
+    dense = bytearray(m)
+    for index, rank in registers.items():
+        dense[index] = rank
+    return HEADER.pack(DENSE, precision) + bytes(dense)
+
+
+def fill_author_sketches(apps, schema_editor):
+    """Объединяет существующие скетчи записей в дневные скетчи авторов."""
+    ViewerSketch = apps.get_model('posts', 'ViewerSketch')
+    AuthorViewerSketch = apps.get_model('posts', 'AuthorViewerSketch')
+    merged = {}
+    rows = ViewerSketch.objects.filter(
+        post__author__isnull=False
+    ).values_list('post__author_id', 'day', 'sketch').order_by().iterator()
+    for author_id, day, data in rows:
+        precision, registers = read_registers(data)
+        current = merged.setdefault((author_id, day), (precision, {}))
+        if current[0] != precision:
+            raise ValueError('Объединять можно скетчи одной точности')
+        target = current[1]
+        for index, rank in registers.items():
+            if rank > target.get(index, 0):
+                target[index] = rank
+    AuthorViewerSketch.objects.bulk_create([
+        AuthorViewerSketch(author_id=author_id, day=day,
+                           sketch=write_registers(*sketch))
+        for (author_id, day), sketch in merged.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0031_fill_archivemonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorViewerSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('sketch', models.BinaryField(verbose_name='Скетч')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='viewer_sketches', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'unique_together': {('author', 'day')},
+            },
+        ),
+        migrations.RunPython(fill_author_sketches, migrations.RunPython.noop),
+    ]
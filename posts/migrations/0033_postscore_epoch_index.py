@@ -0,0 +1,26 @@
+# Generated by Django 2.2.13 on 2026-10-19 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0032_authorviewersketch'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='postscore',
+            options={},
+        ),
+        migrations.AlterField(
+            model_name='postscore',
+            name='score',
+            field=models.FloatField(default=0, verbose_name='Рейтинг'),
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['updated', '-score', 'post'], name='postscore_epoch_top'),
+        ),
+    ]
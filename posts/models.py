@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+
+from .storage import image_storage
+from .text import render_comment, render_post
 
 User = get_user_model()
 
@@ -8,14 +12,39 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    # Денормализованная статистика для каталога сообществ, поддерживается
+    # сигналами (см. posts.group_stats) и командой repair_group_stats
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество записей'
+    )
+    last_post_at = models.DateTimeField(
+        blank=True, null=True,
+        db_index=True,
+        verbose_name='Дата последней записи'
+    )
 
     def __str__(self):
         return self.title
 
 
+class PostManager(models.Manager):
+    """Менеджер по умолчанию: скрывает удалённые записи из всех лент,
+    в том числе из связанных менеджеров ``group.posts`` и
+    ``author.posts``."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Post(models.Model):
     text = models.TextField()
-    pub_date = models.DateTimeField('date published', auto_now_add=True)
+    # HTML текста и сокращения для ленты, см. posts.text
+    text_html = models.TextField(blank=True, editable=False)
+    excerpt_html = models.TextField(blank=True, editable=False)
+    pub_date = models.DateTimeField(
+        'date published', auto_now_add=True, db_index=True
+    )
     author = models.ForeignKey(
         User,
         null=True,
@@ -33,6 +62,7 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=image_storage,
         blank=True, null=True,
         verbose_name='Изображение поста',
         help_text='Изображение к посту'
@@ -41,13 +71,39 @@ class Post(models.Model):
         default=0,
         verbose_name='Количество просмотров записи'
     )
+    # Запись скрывается сразу, а сама она, её комментарии, лайки и
+    # картинка удаляются позже командой purge_deleted_posts
+    deleted_at = models.DateTimeField(
+        blank=True, null=True,
+        db_index=True,
+        verbose_name='Дата удаления'
+    )
+
+    objects = PostManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        # Архивы по месяцам выбирают диапазон дат внутри автора или
+        # сообщества
+        indexes = [
+            models.Index(fields=['author', 'pub_date']),
+            models.Index(fields=['group', 'pub_date']),
+        ]
 
     def __str__(self):
         return self.text[:40]
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            render_post(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {
+                    *update_fields, 'text_html', 'excerpt_html'
+                }
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -63,14 +119,25 @@ class Comment(models.Model):
         verbose_name='Автор'
     )
     text = models.TextField(verbose_name='Текст комментария')
+    # HTML текста со ссылками на упомянутых, см. posts.text
+    text_html = models.TextField(blank=True, editable=False)
     created = models.DateTimeField(
         auto_now_add=True,
+        db_index=True,
         verbose_name='Дата публикации'
     )
 
     def __str__(self):
         return self.text[:40]
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            render_comment(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'text_html'}
+        super().save(*args, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -85,9 +152,18 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор'
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата подписки'
+    )
 
     class Meta:
         unique_together = ['user', 'author']
+        # Списки подписчиков и подписок листаются по (created, id)
+        indexes = [
+            models.Index(fields=['author', 'created', 'id']),
+            models.Index(fields=['user', 'created', 'id']),
+        ]
 
 class Like(models.Model):
     user = models.ForeignKey(
@@ -102,3 +178,380 @@ class Like(models.Model):
         related_name='like'
         )
     created = models.DateTimeField(auto_now_add=True)
+
+
+class PostScore(models.Model):
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score',
+        verbose_name='Пост'
+    )
+    score = models.FloatField(
+        default=0,
+        verbose_name='Рейтинг'
+    )
+    updated = models.DateTimeField(
+        verbose_name='Момент последнего пересчёта рейтинга'
+    )
+
+    class Meta:
+        # Рейтинги сравнимы только внутри эпохи, см. posts.trending
+        indexes = [
+            models.Index(fields=['updated', '-score', 'post'],
+                         name='postscore_epoch_top'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.3f}'
+
+
+class ImageBlob(models.Model):
+    """Файл картинки в хранилище с адресацией по содержимому и число
+    записей, которые на него ссылаются."""
+    name = models.CharField(max_length=100, primary_key=True)
+    refs = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.TextField(default='{}', verbose_name='Аргументы (JSON)')
+    priority = models.SmallIntegerField(
+        default=0,
+        verbose_name='Приоритет',
+        help_text='Задачи с большим приоритетом выполняются раньше'
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=QUEUED,
+        verbose_name='Состояние'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3,
+        verbose_name='Максимум попыток'
+    )
+    run_after = models.DateTimeField(verbose_name='Выполнить после')
+    locked_until = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name='Занята до'
+    )
+    locked_by = models.CharField(
+        max_length=100, blank=True,
+        verbose_name='Обработчик'
+    )
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', '-priority', 'run_after'],
+                name='job_queue_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class ArchiveMonth(models.Model):
+    """Количество записей автора или сообщества за месяц. У строки задан
+    ровно один из ``author`` и ``group``."""
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='archive_months',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='archive_months',
+        verbose_name='Сообщество'
+    )
+    month = models.DateField(verbose_name='Месяц')
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество записей'
+    )
+
+    class Meta:
+        ordering = ('-month',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'month'],
+                condition=models.Q(group__isnull=True),
+                name='archive_author_month'
+            ),
+            models.UniqueConstraint(
+                fields=['group', 'month'],
+                condition=models.Q(author__isnull=True),
+                name='archive_group_month'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.author or self.group} {self.month:%m.%Y}'
+
+
+class MemoryProfile(models.Model):
+    """Суммарные замеры памяти tracemalloc по представлению."""
+    view = models.CharField(max_length=200, unique=True,
+                            verbose_name='Представление')
+    requests = models.PositiveIntegerField(default=0,
+                                           verbose_name='Запросов')
+    net_total = models.BigIntegerField(
+        default=0,
+        verbose_name='Прирост памяти, байт',
+        help_text='Сумма по всем запросам'
+    )
+    peak_total = models.BigIntegerField(default=0,
+                                        verbose_name='Сумма пиков, байт')
+    peak_max = models.BigIntegerField(default=0,
+                                      verbose_name='Максимальный пик, байт')
+    updated = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'профиль памяти'
+        verbose_name_plural = 'профили памяти'
+
+    def __str__(self):
+        return self.view
+
+    @property
+    def net_avg(self):
+        return self.net_total // self.requests if self.requests else 0
+
+    @property
+    def peak_avg(self):
+        return self.peak_total // self.requests if self.requests else 0
+
+
+class MemoryAllocation(models.Model):
+    """Память, оставшаяся выделенной в строке кода после запросов к
+    представлению."""
+    profile = models.ForeignKey(
+        MemoryProfile,
+        on_delete=models.CASCADE,
+        related_name='allocations',
+        verbose_name='Профиль'
+    )
+    site = models.CharField(max_length=300, verbose_name='Место выделения')
+    size_total = models.BigIntegerField(default=0, verbose_name='Байт')
+    count_total = models.BigIntegerField(default=0, verbose_name='Блоков')
+    requests = models.PositiveIntegerField(default=0,
+                                           verbose_name='Запросов')
+
+    class Meta:
+        unique_together = ('profile', 'site')
+        verbose_name = 'место выделения памяти'
+        verbose_name_plural = 'места выделения памяти'
+
+    def __str__(self):
+        return self.site
+
+
+class VisitShard(models.Model):
+    """Часть счётчика просмотров записи. Просмотры распределяются по
+    ``VISIT_SHARDS`` строкам и периодически переносятся в ``Post.visits``.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='visit_shards',
+        verbose_name='Пост'
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='Номер части')
+    count = models.PositiveIntegerField(default=0,
+                                        verbose_name='Просмотров')
+
+    class Meta:
+        unique_together = ('post', 'shard')
+
+    def __str__(self):
+        return f'{self.post_id}/{self.shard}: {self.count}'
+
+
+class ViewerSketch(models.Model):
+    """Скетч HyperLogLog уникальных зрителей записи за день (posts.hll)."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='viewer_sketches',
+        verbose_name='Пост'
+    )
+    day = models.DateField(verbose_name='День')
+    sketch = models.BinaryField(verbose_name='Скетч')
+
+    class Meta:
+        unique_together = ('post', 'day')
+
+    def __str__(self):
+        return f'{self.post_id} {self.day}'
+
+
+class AuthorViewerSketch(models.Model):
+    """Скетч уникальных зрителей всех записей автора за день."""
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='viewer_sketches',
+        verbose_name='Автор'
+    )
+    day = models.DateField(verbose_name='День')
+    sketch = models.BinaryField(verbose_name='Скетч')
+
+    class Meta:
+        unique_together = ('author', 'day')
+
+    def __str__(self):
+        return f'{self.author_id} {self.day}'
+
+
+class EngagementRollup(models.Model):
+    """Просмотры, лайки и комментарии за час или день по записи или по
+    всем записям автора. У строки задан ровно один из ``post`` и
+    ``author``."""
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIODS = (
+        (HOUR, 'Час'),
+        (DAY, 'День'),
+    )
+
+    period = models.CharField(max_length=4, choices=PERIODS,
+                              verbose_name='Период')
+    start = models.DateTimeField(verbose_name='Начало периода')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='rollups',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        blank=True, null=True,
+        related_name='rollups',
+        verbose_name='Автор'
+    )
+    views = models.PositiveIntegerField(default=0, verbose_name='Просмотры')
+    likes = models.PositiveIntegerField(default=0, verbose_name='Лайки')
+    comments = models.PositiveIntegerField(default=0,
+                                           verbose_name='Комментарии')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['author', 'period', 'start'],
+                condition=models.Q(post__isnull=True),
+                name='rollup_author_period'
+            ),
+            models.UniqueConstraint(
+                fields=['post', 'period', 'start'],
+                condition=models.Q(author__isnull=True),
+                name='rollup_post_period'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id or self.author_id} {self.period} {self.start}'
+
+
+class RollupWatermark(models.Model):
+    """Последний учтённый в ``EngagementRollup`` первичный ключ таблицы
+    событий."""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.last_id}'
+
+
+class Tag(models.Model):
+    # Имя хранится в нижнем регистре, см. posts.text.extract_tags
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """Хэштег записи. Дата публикации скопирована из записи, чтобы лента
+    тега читалась по индексу (tag, pub_date) без сортировки."""
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='post_tags'
+    )
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, related_name='post_tags'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('post', 'tag')
+        indexes = [
+            models.Index(fields=['tag', 'pub_date', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} #{self.tag_id}'
+
+
+class Mention(models.Model):
+    """Упоминание пользователя в записи или в комментарии к ней
+    (тогда заполнен ``comment``). Строки пересобираются при сохранении
+    текста, см. posts.mentions."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='mentions'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='mentions'
+    )
+    comment = models.ForeignKey(
+        Comment, on_delete=models.CASCADE, related_name='mentions',
+        blank=True, null=True
+    )
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'user'],
+                condition=models.Q(comment__isnull=True),
+                name='mention_post_user'
+            ),
+            models.UniqueConstraint(
+                fields=['comment', 'user'],
+                condition=models.Q(comment__isnull=False),
+                name='mention_comment_user'
+            ),
+        ]
+
+    def __str__(self):
+        return f'@{self.user_id} {self.post_id}'
@@ -0,0 +1,137 @@
+"""Паджинаторы для больших таблиц.
+
+``COUNT(*)`` по всей таблице в SQLite - полный проход по индексу. Для
+выборки без фильтров ``ApproximateCountPaginator`` берёт количество из
+статистики ``sqlite_stat1`` (её заполняют ``ANALYZE`` и ``PRAGMA
+optimize``), для остальных - из кэша на ``APPROXIMATE_COUNT_TIMEOUT``
+секунд.
+
+``KeysetPaginator`` не считает строки вовсе и не использует OFFSET:
+следующая страница начинается после ключа последней строки предыдущей,
+поэтому глубокие страницы стоят столько же, сколько первая.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def table_estimate(model, using):
+    """Число строк таблицы по статистике планировщика или ``None``."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+    except DatabaseError:
+        # ANALYZE ещё ни разу не выполнялся
+        return None
+    if row is None:
+        return None
+    return int(row[0].split()[0])
+
+
+class ApproximateCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if not queryset.query.where:
+            estimate = table_estimate(queryset.model, queryset.db)
+            if estimate is not None:
+                return estimate
+        try:
+            sql = str(queryset.query)
+        except Exception:
+            return super().count
+        key = 'count:' + hashlib.md5(sql.encode()).hexdigest()
+        return cache.get_or_set(
+            key, queryset.count,
+            getattr(settings, 'APPROXIMATE_COUNT_TIMEOUT', 5 * 60)
+        )
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, is_first):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """Страницы выборки по убыванию полей ``fields`` (последнее из них
+    должно быть уникальным, обычно ``id``). Курсор - непрозрачная строка
+    с ключом последней строки страницы."""
+
+    def __init__(self, queryset, fields, per_page):
+        self.queryset = queryset.order_by(*('-' + name for name in fields))
+        self.fields = fields
+        self.per_page = per_page
+
+    def encode(self, obj):
+        values = [
+            self.queryset.model._meta.get_field(name).value_to_string(obj)
+            for name in self.fields
+        ]
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode().rstrip('=')
+
+    def decode(self, cursor):
+        """Ключ из курсора или ``None``, если курсор испорчен."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(
+                cursor + '=' * (-len(cursor) % 4)
+            ))
+            if len(values) != len(self.fields):
+                return None
+            return [
+                self.queryset.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    def before(self, values):
+        """Условие "ключ строки меньше ``values``" в лексикографическом
+        порядке полей."""
+        condition = Q(**{f'{self.fields[-1]}__lt': values[-1]})
+        for name, value in zip(self.fields[-2::-1], values[-2::-1]):
+            condition = Q(**{f'{name}__lt': value}) | (
+                Q(**{name: value}) & condition
+            )
+        return condition
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset
+        key = self.decode(cursor) if cursor else None
+        if key is not None:
+            queryset = queryset.filter(self.before(key))
+        items = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode(items[-1])
+        return KeysetPage(items, next_cursor, key is None)
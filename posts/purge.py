@@ -0,0 +1,69 @@
+"""Фоновое удаление скрытых записей.
+
+Удаление идёт порциями по ``batch_size`` строк, каждая в своей транзакции,
+так что блокировка на запись удерживается недолго и запросы пользователей
+успевают проходить между порциями.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import CASCADE
+from django.utils import timezone
+
+from .models import Mention, Post
+
+
+def _delete_in_batches(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += queryset.model._base_manager.filter(
+                pk__in=ids
+            ).delete()[0]
+
+
+def _dependents():
+    """Модели, строки которых удаляются каскадом вместе с записью, и поле
+    связи. Упоминания идут первыми: иначе они удалялись бы каскадом от
+    комментариев."""
+    relations = [
+        (relation.related_model, relation.field.name)
+        for relation in Post._meta.related_objects
+        if relation.on_delete is CASCADE and not relation.many_to_many
+    ]
+    relations.sort(key=lambda relation: relation[0] is not Mention)
+    return relations
+
+
+def purge_deleted_posts(batch_size=500, grace=timedelta(0), post_ids=None):
+    """Удаляет записи, скрытые раньше ``grace`` назад, вместе с их
+    комментариями, лайками и остальными зависимыми строками (сводками,
+    скетчами, тегами, упоминаниями) - каждую таблицу порциями, чтобы
+    удаление самих записей ничего не удаляло каскадом. Файлы картинок
+    освобождаются через счётчики ссылок и удаляются командой
+    gc_image_blobs. Возвращает число удалённых записей. ``post_ids``
+    ограничивает очистку указанными записями."""
+    cutoff = timezone.now() - grace
+    hidden = Post.all_objects.filter(
+        deleted_at__isnull=False, deleted_at__lte=cutoff
+    ).order_by('pk')
+    if post_ids is not None:
+        hidden = hidden.filter(pk__in=post_ids)
+    dependents = _dependents()
+    purged = 0
+    while True:
+        posts = list(hidden.only('pk')[:batch_size])
+        if not posts:
+            return purged
+        ids = [post.pk for post in posts]
+        for model, field in dependents:
+            _delete_in_batches(
+                model._base_manager.filter(**{f'{field}__in': ids}),
+                batch_size
+            )
+        with transaction.atomic():
+            Post.all_objects.filter(pk__in=ids).delete()
+        purged += len(ids)
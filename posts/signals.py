@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import archive, blobs, group_stats, jobs, mentions, tags, trending
+from .models import Comment, Like, Post, PostScore
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        trending.bump(instance.post_id, 'like')
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, update_fields=None,
+                    **kwargs):
+    if created:
+        trending.bump(instance.post_id, 'comment')
+    if update_fields is None or 'text' in update_fields:
+        mentions.sync([instance])
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Запоминаем исходное сообщество, чтобы заметить перенос записи.
+    # Отложенное поле не трогаем, иначе каждый пост в выборке с only()
+    # стоил бы отдельного запроса
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_image = blobs.file_name(instance.__dict__.get('image'))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields=None, **kwargs):
+    image = blobs.file_name(instance.__dict__.get('image'))
+    old_image = None if created else instance._initial_image
+    if 'image' in instance.__dict__ and image != old_image:
+        if image:
+            blobs.incref(image)
+            jobs.enqueue('warm_thumbnail', image_name=image)
+        if old_image:
+            blobs.decref(old_image)
+        instance._initial_image = image
+    if update_fields is None or 'text' in update_fields:
+        tags.sync(instance)
+        mentions.sync([instance])
+    if instance.deleted_at is not None and 'deleted_at' in (
+            update_fields or ()):
+        post_hidden(instance)
+        return
+    if created:
+        archive.post_added(instance)
+        if instance.group_id is not None:
+            group_stats.post_added(instance.group_id, instance.pub_date)
+    elif instance._initial_group_id != instance.group_id:
+        old_group_id = instance._initial_group_id
+        archive.post_moved(instance, old_group_id)
+        group_stats.refresh(
+            pk for pk in (old_group_id, instance.group_id)
+            if pk is not None
+        )
+    instance._initial_group_id = instance.group_id
+
+
+def post_hidden(post):
+    archive.post_removed(post)
+    if post.group_id is not None:
+        group_stats.refresh([post.group_id])
+    PostScore.objects.filter(post_id=post.pk).delete()
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    image = blobs.file_name(instance.image)
+    if image:
+        blobs.decref(image)
+    # Для скрытых записей статистика пересчитана ещё при скрытии
+    if instance.deleted_at is None:
+        archive.post_removed(instance)
+        if instance.group_id is not None:
+            group_stats.refresh([instance.group_id])
+
+
+@receiver(post_init, sender=User)
+def remember_user_name(sender, instance, **kwargs):
+    # От имени и активности зависят ссылки в отрисованных упоминаниях
+    instance._initial_mention = (
+        instance.__dict__.get('username'), instance.__dict__.get('is_active')
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    current = (instance.username, instance.is_active)
+    # Регистрация не перерисовывает тексты, см. posts.mentions
+    if not created and current != instance._initial_mention:
+        jobs.enqueue('rerender_mentions', username=instance.username,
+                     user_id=instance.pk)
+    instance._initial_mention = current
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Строки Mention удалены вместе с пользователем, остаётся поиск по имени
+    jobs.enqueue('rerender_mentions', username=instance.username)
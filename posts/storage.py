@@ -0,0 +1,53 @@
+"""Хранилище картинок с адресацией по содержимому.
+
+Файл получает имя по SHA-256 своего содержимого, поэтому одинаковые
+картинки хранятся в одном экземпляре, а sorl-thumbnail строит для них
+миниатюры один раз. Число записей, ссылающихся на файл, хранится в
+``ImageBlob``; файлы без ссылок удаляет команда ``gc_image_blobs``.
+
+Повторная загрузка существующего файла отмечает его строку ``ImageBlob``
+свежей в той же транзакции, что и проверка файла. Сборщик удаляет строку
+и файл одной транзакцией и только у давно не тронутых строк, поэтому
+либо он пропустит отмеченный файл, либо загрузка дождётся конца его
+транзакции, увидит, что файла нет, и запишет его заново.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        from .models import ImageBlob
+
+        name = self.hashed_name(name, content)
+        with transaction.atomic():
+            ImageBlob.objects.filter(name=name).update(
+                updated=timezone.now()
+            )
+            if self.exists(name):
+                # Такой файл уже загружен - переиспользуем его
+                return name
+            return super().save(name, content, max_length=max_length)
+
+
+image_storage = ContentAddressedStorage()
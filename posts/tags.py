@@ -0,0 +1,82 @@
+"""Хэштеги записей.
+
+Теги разбираются из текста при каждом сохранении записи с изменённым
+текстом (сигнал в posts.signals) и хранятся в ``PostTag`` с датой
+публикации записи, так что лента тега - это диапазон индекса
+(tag, pub_date), а не ``LIKE '%#тег%'`` по всем записям. Существующие
+записи размечает команда ``backfill_tags``.
+"""
+from django.db.models import Q
+
+from .models import Post, PostTag, Tag
+from .text import extract_tags
+
+
+def get_tags(names):
+    """Словарь имя -> ``Tag``, недостающие теги создаются."""
+    names = set(names)
+    if not names:
+        return {}
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = names - tags.keys()
+    if missing:
+        # Параллельно созданные теги пропускаются и дочитываются ниже
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in missing], ignore_conflicts=True
+        )
+        tags.update(
+            (tag.name, tag) for tag in Tag.objects.filter(name__in=missing)
+        )
+    return tags
+
+
+def apply(posts):
+    """Приводит теги записей ``posts`` в соответствие с их текстом."""
+    wanted = {post.pk: extract_tags(post.text) for post in posts}
+    tags = get_tags(name for names in wanted.values() for name in names)
+    current = set(PostTag.objects.filter(post__in=wanted).values_list(
+        'post_id', 'tag_id'
+    ))
+    target = {
+        (post_id, tags[name].pk)
+        for post_id, names in wanted.items() for name in names
+    }
+    stale = current - target
+    if stale:
+        condition = Q()
+        for post_id, tag_id in stale:
+            condition |= Q(post_id=post_id, tag_id=tag_id)
+        PostTag.objects.filter(condition).delete()
+    dates = {post.pk: post.pub_date for post in posts}
+    PostTag.objects.bulk_create([
+        PostTag(post_id=post_id, tag_id=tag_id, pub_date=dates[post_id])
+        for post_id, tag_id in target - current
+    ], ignore_conflicts=True)
+
+
+def sync(post):
+    apply([post])
+
+
+def backfill(batch_size=500, start_after=0):
+    """Размечает существующие записи порциями по первичному ключу, не
+    загружая их все в память. Возвращает (обработано записей, последний
+    ключ) - с этого ключа можно продолжить после прерывания."""
+    queryset = Post.all_objects.order_by('pk').only('pk', 'text', 'pub_date')
+    last_pk = start_after
+    total = 0
+    while True:
+        posts = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not posts:
+            return total, last_pk
+        apply(posts)
+        last_pk = posts[-1].pk
+        total += len(posts)
+
+
+def feed(tag):
+    """Записи тега, новые первыми, для ``KeysetPaginator`` по полям
+    (pub_date, id) модели ``PostTag``."""
+    return PostTag.objects.filter(
+        tag=tag, post__deleted_at__isnull=True
+    ).select_related('post__author', 'post__group')
@@ -0,0 +1,37 @@
+"""Фоновые задачи приложения, выполняются командой run_worker."""
+from datetime import timedelta
+
+from yatube import pagecache
+
+from . import mentions
+from .jobs import job
+from .purge import purge_deleted_posts
+from .storage import image_storage
+
+# Должно совпадать с параметрами {% thumbnail %} в includes/post_item.html
+POST_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+
+
+@job('purge_deleted_posts')
+def purge_posts(post_ids=None, batch_size=500):
+    purge_deleted_posts(
+        batch_size=batch_size, grace=timedelta(0), post_ids=post_ids
+    )
+
+
+@job('rerender_mentions')
+def rerender_mentions(username, user_id=None):
+    # bulk_update не вызывает сигналов, кэш страниц сбрасываем сами
+    if mentions.user_changed(username, user_id):
+        pagecache.bump_version()
+
+
+@job('warm_thumbnail')
+def warm_thumbnail(image_name):
+    """Строит миниатюру заранее, чтобы первый показ ленты не ждал её."""
+    from sorl.thumbnail import get_thumbnail
+    from sorl.thumbnail.images import ImageFile
+
+    geometry, options = POST_THUMBNAIL
+    get_thumbnail(ImageFile(image_name, storage=image_storage), geometry,
+                  **options)
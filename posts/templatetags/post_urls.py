@@ -0,0 +1,12 @@
+from django import template
+
+from posts import urlbuilder
+
+register = template.Library()
+
+
+@register.simple_tag
+def fast_url(name, *args):
+    """Как ``{% url %}`` с позиционными аргументами, но без обхода
+    URLconf, см. posts.urlbuilder."""
+    return urlbuilder.build(name, *args)
@@ -1,16 +1,42 @@
+import gzip
 import io
 import os
 import re
 import shutil
 import tempfile
+import tracemalloc
+from datetime import timedelta
+from email.mime.text import MIMEText
+from unittest import mock
 
+from django.conf import settings
+from django.core import mail
 from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
-from django.urls import reverse
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import pre_delete
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import (NoReverseMatch, clear_script_prefix, reverse,
+                         set_script_prefix)
+from django.utils import timezone
 from PIL import Image
+from yatube import db_router, pagecache, ratelimit
+from yatube.storage import CompressedManifestStaticFilesStorage
 
-from .models import Comment, Follow, Group, Post, User
+from . import (analytics, archive, audience, autocomplete, blobs, jobs,
+               loadtest, tags, trending, urlbuilder, visits)
+from .models import (ArchiveMonth, AuthorViewerSketch, Comment,
+                     EngagementRollup, Follow, Group, ImageBlob, Job, Like,
+                     MemoryProfile, Mention, Post, PostScore, PostTag, Tag,
+                     User, VisitShard)
+from .hll import HyperLogLog
+from .paginator import ApproximateCountPaginator
+from .purge import purge_deleted_posts
+from .storage import image_storage
 
 temp_dir = tempfile.mkdtemp()
 
@@ -701,3 +727,1508 @@ class TestHTTPCodes(TestCase):
                 self.assertEqual(
                     response.status_code, 404,
                     msg='Сервер вернул неожиданный код ответа')
+
+
+class TestViewerState(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='HaroldFinch')
+        self.author = User.objects.create_user(username='JohnReese')
+        self.client.force_login(self.user)
+        self.posts = [
+            Post.objects.create(text=f'Post {i}', author=self.author)
+            for i in range(3)
+        ]
+        Like.objects.create(user=self.user, post=self.posts[0])
+        Follow.objects.create(user=self.user, author=self.author)
+        cache.clear()
+
+    def test_feed_viewer_state(self):
+        """Состояние лайков и подписок проставляется всем постам страницы"""
+        response = self.client.get(reverse('index'))
+        page = {post.pk: post for post in response.context['page']}
+        self.assertTrue(page[self.posts[0].pk].is_liked)
+        self.assertFalse(page[self.posts[1].pk].is_liked)
+        self.assertTrue(
+            all(post.is_following for post in page.values()),
+            msg='Подписка на автора не отмечена в карточках'
+        )
+
+    def test_anonymous_post_view(self):
+        """Страница поста доступна неавторизованному пользователю"""
+        response = Client().get(
+            reverse('post', args=[self.author.username, self.posts[0].pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['is_liked'])
+
+
+class TestTrending(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='HaroldFinch')
+        self.quiet = Post.objects.create(text='Quiet', author=self.user)
+        self.loud = Post.objects.create(text='Loud', author=self.user)
+        cache.clear()
+
+    def test_events_update_score(self):
+        """Лайки и комментарии увеличивают рейтинг без пересчёта"""
+        Like.objects.create(user=self.user, post=self.loud)
+        Comment.objects.create(post=self.loud,
+                               author=self.user, text='Wow')
+        row = PostScore.objects.get(post=self.loud)
+        self.assertAlmostEqual(
+            trending.decay(row.score, row.updated, timezone.now()),
+            trending.WEIGHTS['like'] + trending.WEIGHTS['comment'],
+            places=3
+        )
+
+    def test_bump_is_single_write(self):
+        """Событие учитывается одним запросом без чтения строки"""
+        with CaptureQueriesContext(connection) as queries:
+            trending.bump(self.loud.pk, 'like')
+            trending.bump(self.loud.pk, 'like')
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertFalse(any(query['sql'].startswith('SELECT')
+                             for query in queries.captured_queries))
+
+    def test_epochs(self):
+        """Рейтинг переходит в новую эпоху, а порядок лучших учитывает
+        затухание"""
+        start = trending.epoch_start(timezone.now())
+        step = timedelta(seconds=trending.HALF_LIFE)
+        before = start - step
+        trending.bump(self.loud.pk, 'comment', now=before)
+        trending.bump(self.quiet.pk, 'like', now=start + step)
+        trending.bump(self.loud.pk, 'comment', now=start + step)
+        row = PostScore.objects.get(post=self.loud)
+        self.assertEqual(row.updated, start)
+        self.assertAlmostEqual(
+            trending.decay(row.score, row.updated, start + step),
+            5 * 0.5 ** 2 + 5
+        )
+        # Старая запись с большим сохранённым значением затухла сильнее
+        later = start + step * 3
+        PostScore.objects.filter(post=self.loud).update(
+            updated=start - timedelta(seconds=trending.EPOCH_LENGTH),
+            score=PostScore.objects.get(post=self.quiet).score * 1000
+        )
+        self.assertEqual(trending.top_ids(later), [self.quiet.pk,
+                                                   self.loud.pk])
+        # Строки старше прошлой эпохи удаляются
+        kept, removed = trending.refresh(
+            start + timedelta(seconds=trending.EPOCH_LENGTH * 2)
+        )
+        self.assertEqual((kept, removed), (0, 2))
+
+    def test_decay(self):
+        """За период полураспада рейтинг уменьшается вдвое"""
+        now = timezone.now()
+        later = now + timedelta(seconds=trending.HALF_LIFE)
+        self.assertAlmostEqual(trending.decay(8, now, later), 4)
+
+    def test_trending_page(self):
+        """Страница популярного упорядочена по рейтингу"""
+        trending.bump(self.quiet.pk, 'visit')
+        trending.bump(self.loud.pk, 'like')
+        trending.refresh()
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(
+            [post.pk for post in response.context['page']],
+            [self.loud.pk, self.quiet.pk]
+        )
+
+
+class TestGroupDirectory(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='HaroldFinch')
+        self.group = Group.objects.create(title='Person of Interest',
+                                          slug='PoV')
+        self.group2 = Group.objects.create(title='Game of Thrones',
+                                           slug='GoT')
+        cache.clear()
+
+    def test_stats_follow_posts(self):
+        """Счётчики сообществ обновляются при создании, переносе и
+        удалении записей"""
+        post = Post.objects.create(text='Text', author=self.user,
+                                   group=self.group)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(self.group.last_post_at, post.pub_date)
+        post.group = self.group2
+        post.save()
+        self.group.refresh_from_db()
+        self.group2.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        self.assertIsNone(self.group.last_post_at)
+        self.assertEqual(self.group2.post_count, 1)
+        post.delete()
+        self.group2.refresh_from_db()
+        self.assertEqual(self.group2.post_count, 0)
+
+    def test_directory_single_query(self):
+        """Каталог сообществ не делает запросов на каждое сообщество"""
+        for i in range(5):
+            Group.objects.create(title=f'Group {i}', slug=f'group-{i}')
+        # Запрос количества для паджинатора и выборка страницы
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('group_index'))
+        self.assertEqual(len(response.context['page']), 7)
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class TestReplicaRouter(TestCase):
+    def setUp(self):
+        self.router = db_router.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        db_router.use_replica(False)
+
+    def test_reads_go_to_replica(self):
+        """В безопасном запросе лента читается с реплики, а после записи -
+        с основной базы"""
+        db_router.use_replica(True)
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Like), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_outside_request_uses_primary(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_pin_after_write(self):
+        """После записи браузер закрепляется за основной базой"""
+        def view(request):
+            self.router.db_for_write(Follow)
+            return HttpResponse()
+
+        middleware = db_router.ReplicaPinningMiddleware(view)
+        response = middleware(self.factory.get('/'))
+        cookie = response.cookies[db_router.PIN_COOKIE].value
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+        def read_view(request):
+            return HttpResponse(self.router.db_for_read(Post))
+
+        middleware = db_router.ReplicaPinningMiddleware(read_view)
+        request = self.factory.get('/')
+        request.COOKIES[db_router.PIN_COOKIE] = cookie
+        self.assertEqual(middleware(request).content, b'default')
+        self.assertEqual(
+            middleware(self.factory.get('/')).content, b'replica'
+        )
+
+    def test_bookkeeping_does_not_pin(self):
+        """Служебные записи не закрепляют браузер, а их чтение идёт с
+        основной базы"""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Post))
+            with db_router.bookkeeping():
+                reads.append(self.router.db_for_read(VisitShard))
+                self.router.db_for_write(VisitShard)
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        middleware = db_router.ReplicaPinningMiddleware(view)
+        response = middleware(self.factory.get('/'))
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+        self.assertEqual(reads, ['replica', 'default', 'replica'])
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_no_cookie_without_replica(self):
+        author = User.objects.create_user(username='Root')
+        post = Post.objects.create(text='x', author=author)
+        response = self.client.get(reverse('post', args=['Root', post.pk]))
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+        self.client.force_login(author)
+        response = self.client.get(
+            reverse('new_like', args=['Root', post.pk])
+        )
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+
+class TestSQLiteTuning(TestCase):
+    def test_pragmas_applied(self):
+        """Соединение с SQLite открывается с настройками из settings"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0],
+                settings.SQLITE_PRAGMAS['busy_timeout']
+            )
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class TestSoftDelete(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='HaroldFinch')
+        self.client.force_login(self.user)
+        self.group = Group.objects.create(title='Person of Interest',
+                                          slug='PoV')
+        self.post = Post.objects.create(text='Delete me', author=self.user,
+                                        group=self.group)
+        Comment.objects.create(post=self.post, author=self.user, text='Hi')
+        Like.objects.create(post=self.post, user=self.user)
+        cache.clear()
+
+    def test_delete_hides_post(self):
+        """Удалённая запись сразу пропадает из лент, но остаётся в базе
+        до фоновой очистки"""
+        self.client.get(
+            reverse('post_delete', args=[self.user.username, self.post.pk])
+        )
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(Comment.objects.count(), 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        for url in (reverse('index'), reverse('group', args=['PoV']),
+                    reverse('profile', args=[self.user.username])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.context['paginator'].count, 0)
+        response = self.client.get(
+            reverse('post', args=[self.user.username, self.post.pk])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_purge(self):
+        """Очистка удаляет скрытые записи вместе с комментариями и
+        лайками"""
+        alive = Post.objects.create(text='Keep me', author=self.user)
+        mentioned = User.objects.create_user(username='Mentioned')
+        self.post.text = '#purge @Mentioned'
+        self.post.deleted_at = timezone.now()
+        self.post.save(update_fields=['text', 'deleted_at'])
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='@Mentioned')
+        visits.increment(self.post.pk)
+        audience.record_view(self.post.pk, 'user:1')
+        self.assertEqual(Mention.objects.filter(user=mentioned).count(), 2)
+        left = []
+
+        def count_dependents(sender, instance, **kwargs):
+            left.append(sum(
+                relation.related_model._base_manager.filter(
+                    **{relation.field.name: instance}
+                ).count()
+                for relation in Post._meta.related_objects
+            ))
+
+        # К удалению самой записи зависимые строки уже удалены порциями
+        pre_delete.connect(count_dependents, sender=Post)
+        try:
+            self.assertEqual(purge_deleted_posts(batch_size=1), 1)
+        finally:
+            pre_delete.disconnect(count_dependents, sender=Post)
+        self.assertEqual(left, [0])
+        self.assertEqual(list(Post.all_objects.all()), [alive])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Mention.objects.exists())
+        self.assertFalse(PostTag.objects.exists())
+
+
+class TestRenderedText(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='HaroldFinch')
+
+    def test_rendered_on_save(self):
+        """HTML текста экранируется и сохраняется вместе с записью"""
+        post = Post.objects.create(text='<b>1</b>\nline', author=self.user)
+        self.assertEqual(post.text_html, '&lt;b&gt;1&lt;/b&gt;<br>line')
+        self.assertEqual(post.excerpt_html, '')
+        post.text = 'a' * 400
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt_html, 'a' * 299 + '…')
+
+    def test_backfill(self):
+        post = Post.objects.create(text='Old\npost', author=self.user)
+        Post.objects.filter(pk=post.pk).update(text_html='')
+        # До заполнения карточка показывает исходный текст
+        response = self.client.get(
+            reverse('post', args=['HaroldFinch', post.pk])
+        )
+        self.assertContains(response, '<p>Old<br>post</p>')
+        call_command('backfill_post_html', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, 'Old<br>post')
+
+
+@override_settings(MEDIA_ROOT=(temp_dir + '/serve'))
+class TestMediaServing(TestCase):
+    def setUp(self):
+        os.makedirs(temp_dir + '/serve/posts', exist_ok=True)
+        with open(temp_dir + '/serve/posts/pic.jpg', 'wb') as file:
+            file.write(b'0123456789')
+        self.url = settings.MEDIA_URL + 'posts/pic.jpg'
+        cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(temp_dir + '/serve', ignore_errors=True)
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        """Отдаётся только запрошенный диапазон байт"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_outside_allowed_dirs(self):
+        for path in ('../settings.py', 'other/pic.jpg', 'posts/../x'):
+            with self.subTest(path=path):
+                response = self.client.get(settings.MEDIA_URL + path)
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=(temp_dir + '/blobs'))
+class TestImageDeduplication(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='HaroldFinch')
+        img = Image.new('RGB', (10, 10), color='red')
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG')
+        self.content = buf.getvalue()
+
+    def tearDown(self):
+        shutil.rmtree(temp_dir + '/blobs', ignore_errors=True)
+
+    def create_post(self, name):
+        return Post.objects.create(
+            author=self.user, text='Meme',
+            image=SimpleUploadedFile(name, self.content, 'image/jpeg')
+        )
+
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом со счётчиком
+        ссылок"""
+        first = self.create_post('meme.jpg')
+        second = self.create_post('copy.JPG')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(first.image.path))), 1
+        )
+        self.assertEqual(ImageBlob.objects.get().refs, 2)
+        path = first.image.path
+        first.delete()
+        second.delete()
+        self.assertEqual(ImageBlob.objects.get().refs, 0)
+        call_command('gc_image_blobs', grace=0, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_reupload_survives_collection(self):
+        """Повторная загрузка файла без ссылок не даёт сборщику удалить
+        его, а уже удалённый файл записывается заново"""
+        post = self.create_post('meme.jpg')
+        path = post.image.path
+        post.delete()
+        ImageBlob.objects.update(updated=timezone.now() - timedelta(days=2))
+        # Файл загружен, а запись с ним ещё не сохранена
+        image_storage.save('posts/again.jpg', ContentFile(self.content))
+        self.assertEqual(blobs.collect(timedelta(days=1)), 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(blobs.collect(timedelta(0)), 1)
+        self.assertFalse(os.path.exists(path))
+        third = self.create_post('third.jpg')
+        self.assertEqual(third.image.path, path)
+        self.assertTrue(os.path.exists(path))
+
+
+class TestAdminPerformance(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='root', email='root@example.com', password='pass'
+        )
+        self.client.force_login(self.admin)
+        cache.clear()
+
+    def create_rows(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'Post {i}', author=self.admin)
+            Comment.objects.create(post=post, author=self.admin, text='Hi')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_constant(self):
+        """Количество запросов списка в админке не зависит от числа
+        строк"""
+        urls = (
+            reverse('admin:posts_post_changelist'),
+            reverse('admin:posts_comment_changelist'),
+        )
+        self.create_rows(2)
+        before = {url: self.count_queries(url) for url in urls}
+        self.create_rows(10)
+        cache.clear()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), before[url])
+
+    def test_estimated_count(self):
+        """Без фильтров количество берётся из статистики SQLite"""
+        self.create_rows(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Post.objects.create(text='Not analyzed yet', author=self.admin)
+        paginator = ApproximateCountPaginator(
+            Post.all_objects.all(), 10
+        )
+        self.assertEqual(paginator.count, 3)
+        paginator = ApproximateCountPaginator(Post.objects.all(), 10)
+        self.assertEqual(paginator.count, 4)
+        # Список записей в админке без фильтров берёт оценку
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_indexed_search(self):
+        self.create_rows(2)
+        url = reverse('admin:posts_comment_changelist')
+        post = Post.objects.first()
+        response = self.client.get(url, {'q': f'#{post.pk}'})
+        self.assertEqual(
+            [item.post_id for item in response.context['cl'].result_list],
+            [post.pk]
+        )
+        response = self.client.get(url, {'q': '@nobody'})
+        self.assertEqual(len(response.context['cl'].result_list), 0)
+
+
+class TestJobQueue(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.job('test_job')(self.record)
+
+    def tearDown(self):
+        jobs.registry.pop('test_job')
+
+    def record(self, value, fail=False):
+        self.calls.append(value)
+        if fail:
+            raise ValueError('Ошибка')
+
+    def test_enqueue_and_run(self):
+        """Задачи выполняются по приоритету"""
+        jobs.enqueue('test_job', value='low')
+        jobs.enqueue('test_job', value='high', priority=5)
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(self.calls, ['high', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+    def test_claim_once(self):
+        """Захваченную задачу не может взять другой обработчик, пока не
+        истечёт таймаут видимости"""
+        jobs.enqueue('test_job', value=1)
+        self.assertIsNotNone(jobs.claim('first'))
+        self.assertIsNone(jobs.claim('second'))
+        later = timezone.now() + jobs.visibility_timeout() + timedelta(1)
+        self.assertEqual(jobs.claim('second', now=later).locked_by, 'second')
+
+    def test_retries(self):
+        task = jobs.enqueue('test_job', value=1, fail=True, max_attempts=2)
+        jobs.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Job.QUEUED)
+        self.assertIn('ValueError', task.last_error)
+        Job.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Job.FAILED)
+        self.assertEqual(self.calls, [1, 1])
+
+    @override_settings(
+        EMAIL_BACKEND='posts.jobs.QueuedEmailBackend',
+        JOBS_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_queued_email(self):
+        """Письмо сброса пароля отправляется обработчиком, а не в
+        запросе"""
+        User.objects.create_user(username='HaroldFinch',
+                                 email='finch@example.com',
+                                 password='Machine-2011')
+        self.client.post(reverse('password_reset'),
+                         {'email': 'finch@example.com'})
+        self.assertEqual(len(mail.outbox), 0)
+        jobs.run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['finch@example.com'])
+
+    @override_settings(
+        JOBS_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_queued_email_keeps_attachments_and_headers(self):
+        message = mail.EmailMessage(
+            'Отчёт', 'Во вложении', to=['finch@example.com'],
+            headers={'X-Report': '42'}
+        )
+        message.attach('report.csv', 'a,b\n', 'text/csv')
+        message.attach('logo.png', b'\x89PNG\x00', 'image/png')
+        jobs.QueuedEmailBackend().send_messages([message])
+        jobs.run_pending()
+        sent = mail.outbox[0]
+        self.assertEqual(sent.extra_headers, {'X-Report': '42'})
+        self.assertEqual(sent.attachments, [
+            ('report.csv', 'a,b\n', 'text/csv'),
+            ('logo.png', b'\x89PNG\x00', 'image/png'),
+        ])
+        message.attachments = [MIMEText('raw')]
+        with self.assertRaises(ValueError):
+            jobs.QueuedEmailBackend().send_messages([message])
+
+    def test_crashing_job_fails_after_max_attempts(self):
+        """Задача, после которой обработчик не отчитался, не повторяется
+        бесконечно"""
+        task = jobs.enqueue('test_job', value=1, max_attempts=2)
+        now = timezone.now()
+        step = jobs.visibility_timeout() + timedelta(seconds=1)
+        # Обработчик захватывает задачу и "падает", не выполнив её
+        self.assertIsNotNone(jobs.claim('first', now=now))
+        self.assertIsNotNone(jobs.claim('second', now=now + step))
+        self.assertIsNone(jobs.claim('third', now=now + step * 2))
+        self.assertEqual(jobs.expire(now + step * 2), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Job.FAILED)
+
+    @override_settings(JOBS_DONE_RETENTION=60)
+    def test_prune_done(self):
+        jobs.enqueue('test_job', value=1)
+        jobs.enqueue('test_job', value=2, fail=True, max_attempts=1)
+        jobs.run_pending()
+        self.assertEqual(jobs.prune(), 0)
+        later = timezone.now() + timedelta(minutes=2)
+        self.assertEqual(jobs.prune(later), 1)
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)),
+                         [Job.FAILED])
+
+
+class TestRateLimit(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='HaroldFinch')
+        self.author = User.objects.create_user(username='JohnReese')
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def test_token_bucket(self):
+        """Ведро позволяет сделать запросы подряд, а затем пополняется с
+        заданной скоростью"""
+        now = 1000.0
+        for _ in range(3):
+            self.assertIsNone(ratelimit.hit(cache, 'key', '3/m', now))
+        self.assertAlmostEqual(ratelimit.hit(cache, 'key', '3/m', now), 20)
+        self.assertIsNotNone(ratelimit.hit(cache, 'key', '3/m', now + 19))
+        self.assertIsNone(ratelimit.hit(cache, 'key', '3/m', now + 20))
+
+    @override_settings(RATELIMITS={'profile_follow': '2/m'})
+    def test_too_many_requests(self):
+        url = reverse('profile_follow', args=[self.author.username])
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).status_code, 302)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+        # Остальные страницы не ограничиваются
+        self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+
+    @override_settings(RATELIMITS={'new_post': '1/m'})
+    def test_form_render_not_counted(self):
+        url = reverse('new_post')
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'text': 'Первый'})
+        self.assertEqual(self.client.post(url, {'text': 'Второй'})
+                         .status_code, 429)
+
+    @override_settings(
+        RATELIMITS={'new_post': '1/m'},
+        RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR',
+        RATELIMIT_TRUSTED_PROXIES=('10.0.0.1',)
+    )
+    def test_clients_behind_proxy(self):
+        """За доверенным прокси у каждого клиента своё ведро, а вошедших
+        ограничивает их собственное"""
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        url = reverse('new_post')
+        for address in ('1.1.1.1', '2.2.2.2'):
+            response = client.post(url, HTTP_X_FORWARDED_FOR=address)
+            self.assertEqual(response.status_code, 302)
+        response = client.post(url, HTTP_X_FORWARDED_FOR='1.1.1.1')
+        self.assertEqual(response.status_code, 429)
+        # Чужой клиент не может подделать адрес без доверенного прокси
+        request = RequestFactory().post(
+            url, REMOTE_ADDR='3.3.3.3', HTTP_X_FORWARDED_FOR='1.1.1.1'
+        )
+        self.assertEqual(ratelimit.client_ip(request), '3.3.3.3')
+        other = User.objects.create_user(username='Root')
+        for user in (self.user, other):
+            self.client.force_login(user)
+            self.client.post(url, {'text': 'x'},
+                             REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(Post.objects.count(), 2)
+
+
+class TestStaticPipeline(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'css'))
+        with open(os.path.join(self.root, 'css', 'site.css'), 'w') as file:
+            file.write('body { color: red; }\n' * 100)
+        self.storage = CompressedManifestStaticFilesStorage(
+            location=self.root, base_url='/static/'
+        )
+        list(self.storage.post_process(
+            {'css/site.css': (self.storage, 'css/site.css')}
+        ))
+        self.hashed = self.storage.stored_name('css/site.css')
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_collect_writes_compressed_copies(self):
+        self.assertRegex(self.hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+        with gzip.open(self.storage.path(self.hashed + '.gz')) as file:
+            self.assertEqual(file.read().decode(),
+                             'body { color: red; }\n' * 100)
+        # Без манифеста ссылка ведёт на исходное имя
+        self.assertEqual(self.storage.stored_name('missing.js'),
+                         'missing.js')
+
+    def test_serving_negotiates_encoding(self):
+        """Клиенту, принимающему gzip, отдаётся сжатая копия"""
+        with override_settings(STATIC_ROOT=self.root), \
+                mock.patch('django.contrib.staticfiles.storage.'
+                           'staticfiles_storage', self.storage):
+            url = '/static/' + self.hashed
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            response = self.client.get('/static/css/site.css')
+            self.assertNotIn('immutable', response['Cache-Control'])
+
+
+class TestAnonymousPageCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='HaroldFinch')
+        self.post = Post.objects.create(text='Cached', author=self.user)
+        cache.clear()
+
+    def test_anonymous_hit_skips_stack(self):
+        """Повторный анонимный запрос отдаётся из кэша без запросов к
+        базе, а новая запись сбрасывает кэш"""
+        url = reverse('index')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        Post.objects.create(text='Fresh post', author=self.user)
+        self.assertContains(self.client.get(url), 'Fresh post')
+
+    def test_post_page_cached(self):
+        """Страница записи не ставит cookie и попадает в кэш, а просмотр
+        из кэша всё равно учитывается"""
+        url = reverse('post', args=['HaroldFinch', self.post.pk])
+        first = self.client.get(url)
+        self.assertFalse(first.cookies)
+        second = self.client.get(url, HTTP_USER_AGENT='other')
+        # Шаблон не отрисовывался - ответ взят из кэша
+        self.assertIsNone(second.context)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(visits.pending(self.post.pk), 2)
+        self.assertEqual(audience.unique_viewers(post=self.post), 2)
+        self.assertEqual(
+            audience.author_daily_viewers(self.user)[0][1], 2
+        )
+        self.assertGreater(
+            PostScore.objects.get(post=self.post).score, 0
+        )
+
+    def test_login_keeps_cache(self):
+        """Вход пользователя не сбрасывает кэш страниц"""
+        self.user.set_password('secret-pass')
+        self.user.save()
+        version = pagecache.content_version(cache)
+        self.assertTrue(Client().login(username='HaroldFinch',
+                                       password='secret-pass'))
+        self.assertEqual(pagecache.content_version(cache), version)
+
+    def test_authenticated_not_cached(self):
+        self.client.get(reverse('index'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Новый пост')
+
+
+class TestMonthlyArchive(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='SamanthaGroves')
+        self.group = Group.objects.create(title='Machine', slug='machine')
+        self.other = Group.objects.create(title='Samaritan', slug='samaritan')
+        self.old = Post.objects.create(
+            text='Old news', author=self.user, group=self.group
+        )
+        self.old.pub_date = timezone.now() - timedelta(days=400)
+        self.old.save()
+        archive.rebuild()
+        cache.clear()
+
+    def counts(self, **scope):
+        return dict(ArchiveMonth.objects.filter(
+            post_count__gt=0, **scope
+        ).values_list(
+            'month', 'post_count'
+        ))
+
+    def test_signals_keep_rollup(self):
+        post = Post.objects.create(
+            text='Fresh', author=self.user, group=self.group
+        )
+        month = archive.month_of(post.pub_date)
+        old_month = archive.month_of(self.old.pub_date)
+        self.assertEqual(self.counts(author=self.user),
+                         {month: 1, old_month: 1})
+        post.group = self.other
+        post.save()
+        self.assertEqual(self.counts(group=self.group), {old_month: 1})
+        self.assertEqual(self.counts(group=self.other), {month: 1})
+        post.deleted_at = timezone.now()
+        post.save(update_fields=['deleted_at'])
+        self.assertEqual(self.counts(author=self.user), {old_month: 1})
+        self.old.delete()
+        self.assertEqual(self.counts(author=self.user), {})
+
+    def test_out_of_range_month(self):
+        for year, month in ((99999999999999999999, 1), (0, 1), (2026, 13),
+                            (9999, 12)):
+            with self.subTest(year=year, month=month):
+                response = self.client.get(reverse(
+                    'author_archive_month',
+                    args=['SamanthaGroves', year, month]
+                ))
+                self.assertEqual(response.status_code, 404)
+
+    def test_month_page(self):
+        month = archive.month_of(self.old.pub_date)
+        response = self.client.get(
+            reverse('author_archive', args=['SamanthaGroves'])
+        )
+        url = reverse('author_archive_month',
+                      args=['SamanthaGroves', month.year, month.month])
+        self.assertContains(response, url)
+        response = self.client.get(url)
+        self.assertContains(response, 'Old news')
+        self.assertIn('public', response['Cache-Control'])
+        response = self.client.get(reverse(
+            'group_archive_month', args=['machine', month.year, month.month]
+        ))
+        self.assertContains(response, 'Old news')
+        now = timezone.localtime()
+        response = self.client.get(reverse(
+            'group_archive_month', args=['machine', now.year, now.month]
+        ))
+        self.assertNotContains(response, 'Old news')
+        self.assertFalse(response.has_header('Cache-Control'))
+        response = self.client.get(reverse(
+            'group_archive_month', args=['machine', 2020, 13]
+        ))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestLoadHarness(TestCase):
+    def test_mix_and_percentiles(self):
+        self.assertEqual(loadtest.parse_mix('feed=3, post=1'),
+                         {'feed': 3, 'post': 1})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('feed=1,delete_everything=1')
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 0.5), 50)
+        self.assertEqual(loadtest.percentile(values, 0.99), 99)
+        self.assertEqual(loadtest.percentile([], 0.5), 0)
+
+    def test_recorder_summary(self):
+        recorder = loadtest.Recorder()
+        recorder.add('post', 0.01, 200)
+        recorder.add('post', 0.03, 500)
+        recorder.add('new_post', 0.02, 429)
+        recorder.add('new_post', 0.04, None)
+        rows = {row['name']: row for row in recorder.summary(2)}
+        self.assertEqual(rows['post']['requests'], 2)
+        self.assertEqual(rows['post']['rps'], 1)
+        self.assertEqual(rows['post']['error_rate'], 0.5)
+        self.assertEqual(rows['new_post']['limited'], 1)
+        self.assertEqual(rows['new_post']['max'], 0.04)
+
+    def test_lock_monitor_counts_slow_writes(self):
+        monitor = loadtest.LockMonitor(threshold=0)
+        with connection.execute_wrapper(monitor):
+            User.objects.create_user(username='Root')
+            list(User.objects.all())
+        self.assertEqual(monitor.waits, 1)
+        self.assertEqual(loadtest.url_name('/new/?page=2'), 'new_post')
+
+
+class TestMemoryProfile(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Fusco')
+        self.post = Post.objects.create(text='Tracked', author=self.user)
+        cache.clear()
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_middleware_records_views(self):
+        with override_settings(MEMORY_PROFILE=True, PAGE_CACHE_VIEWS=()):
+            client = Client()
+            client.get(reverse('index'))
+            client.get(reverse('index'))
+        profile = MemoryProfile.objects.get(view='index')
+        self.assertEqual(profile.requests, 2)
+        self.assertGreater(profile.peak_max, 0)
+        self.assertTrue(profile.allocations.exists())
+        self.assertFalse(MemoryProfile.objects.filter(
+            view='post').exists())
+
+    def test_disabled_by_default(self):
+        self.client.get(reverse('index'))
+        self.assertFalse(MemoryProfile.objects.exists())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_hot_spots_are_bounded(self):
+        """Лайки автора считаются одним запросом, а комментарии выводятся
+        постранично"""
+        for n in range(60):
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text=f'Comment {n}')
+        Like.objects.create(post=self.post, user=self.user)
+        response = self.client.get(
+            reverse('profile', args=['Fusco'])
+        )
+        self.assertEqual(response.context['author_likes'], 1)
+        url = reverse('post', args=['Fusco', self.post.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'Comment 49')
+        self.assertNotContains(response, 'Comment 50<')
+        self.assertContains(response, '?comments=2')
+        response = self.client.get(url + '?comments=2')
+        self.assertContains(response, 'Comment 59')
+
+
+class TestShardedVisits(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Shaw')
+        self.post = Post.objects.create(text='Viral', author=self.user)
+
+    def test_views_go_to_shards(self):
+        url = reverse('post', args=['Shaw', self.post.pk])
+        # Анонимные просмотры отдаются из кэша страниц
+        self.client.force_login(self.user)
+        with mock.patch.object(Post, 'save') as saved:
+            for _ in range(5):
+                self.client.get(url)
+        # Запись больше не сохраняется целиком на каждый просмотр
+        saved.assert_not_called()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.visits, 0)
+        self.assertEqual(visits.pending(self.post.pk), 5)
+        self.assertLessEqual(self.post.visit_shards.count(), visits.SHARDS)
+
+    def test_fold_keeps_concurrent_increments(self):
+        for _ in range(20):
+            visits.increment(self.post.pk)
+        other = Post.objects.create(text='Quiet', author=self.user)
+        visits.increment(other.pk, 3)
+        self.assertEqual(visits.fold(batch_size=2), 2)
+        self.post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.post.visits, other.visits), (20, 3))
+        self.assertFalse(VisitShard.objects.exists())
+        visits.increment(self.post.pk)
+        visits.fold()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.visits, 21)
+
+
+class TestUniqueViewers(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Elias')
+        self.post = Post.objects.create(text='Watched', author=self.user)
+
+    def test_sketch_accuracy_and_size(self):
+        sketch = HyperLogLog()
+        for n in range(20000):
+            sketch.add(f'viewer{n}')
+        self.assertAlmostEqual(sketch.count(), 20000, delta=20000 * 0.04)
+        data = sketch.to_bytes()
+        self.assertLessEqual(len(data), 16 * 1024 + 2)
+        self.assertEqual(HyperLogLog.from_bytes(data).count(),
+                         sketch.count())
+        small = HyperLogLog()
+        for n in range(10):
+            small.add(f'viewer{n}')
+        self.assertEqual(small.count(), 10)
+        self.assertLess(len(small.to_bytes()), 64)
+
+    def test_fold_matches_lower_precision(self):
+        """Свёрнутый скетч совпадает с построенным при меньшей точности,
+        и старые скетчи объединяются с новыми"""
+        for total in (50, 20000):
+            high, low = HyperLogLog(14), HyperLogLog(13)
+            for n in range(total):
+                high.add(f'viewer{n}')
+                low.add(f'viewer{n}')
+            self.assertEqual(high.fold(13).to_bytes(), low.to_bytes())
+        old, new = HyperLogLog(13), HyperLogLog()
+        for n in range(3000):
+            old.add(f'viewer{n}')
+        for n in range(2000, 5000):
+            new.add(f'viewer{n}')
+        new.merge(old)
+        self.assertEqual(new.precision, 13)
+        self.assertAlmostEqual(new.count(), 5000, delta=5000 * 0.04)
+
+    def test_merge_is_union(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for n in range(6000):
+            first.add(f'viewer{n}')
+        for n in range(3000, 9000):
+            second.add(f'viewer{n}')
+        first.merge(second)
+        self.assertAlmostEqual(first.count(), 9000, delta=9000 * 0.04)
+
+    def test_post_view_counts_viewers_once(self):
+        reader = User.objects.create_user(username='Root')
+        url = reverse('post', args=['Elias', self.post.pk])
+        self.client.force_login(reader)
+        for _ in range(3):
+            self.client.get(url)
+        self.client.force_login(self.user)
+        self.client.get(url)
+        self.assertEqual(audience.unique_viewers(post=self.post), 2)
+        # Повторный просмотр не меняет скетч и не пишет в базу
+        self.assertFalse(
+            audience.record_view(self.post.pk, f'user:{reader.pk}')
+        )
+
+    def test_days_merge_for_author(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        for n in range(5):
+            audience.record_view(self.post.pk, f'user:{n}', day=yesterday)
+        for n in range(3, 8):
+            audience.record_view(self.post.pk, f'user:{n}', day=today)
+        self.assertEqual(
+            audience.unique_viewers(post__author=self.user), 8
+        )
+        self.assertEqual(
+            audience.daily_unique_viewers(post__author=self.user),
+            [(yesterday, 5), (today, 5)]
+        )
+
+    def test_author_sketch_follows_posts(self):
+        other = Post.objects.create(text='Second', author=self.user)
+        today = timezone.localdate()
+        for n in range(4):
+            audience.record_view(self.post.pk, f'user:{n}')
+        for n in range(2, 6):
+            audience.record_view(other.pk, f'user:{n}',
+                                 author_id=self.user.pk)
+        self.assertEqual(AuthorViewerSketch.objects.count(), 1)
+        self.assertEqual(audience.author_daily_viewers(self.user),
+                         [(today, 6)])
+        # Статистика автора не читает скетчи отдельных записей
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('author_analytics', args=['Elias']))
+        self.assertFalse(any(
+            'posts_viewersketch' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+
+class TestEngagementRollups(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Greer')
+        self.reader = User.objects.create_user(username='Lambert')
+        self.post = Post.objects.create(text='Northern Lights',
+                                        author=self.author)
+        self.later = timezone.now() + timedelta(minutes=5)
+
+    def rollup(self, **scope):
+        return EngagementRollup.objects.get(
+            period=EngagementRollup.DAY, **scope
+        )
+
+    def test_incremental_rollup(self):
+        Like.objects.create(post=self.post, user=self.reader)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Hi')
+        # Свежие события ждут следующего запуска
+        self.assertEqual(analytics.process('likes'), 0)
+        analytics.rollup(now=self.later)
+        analytics.rollup(now=self.later)
+        row = self.rollup(author=self.author, post__isnull=True)
+        self.assertEqual((row.likes, row.comments), (1, 1))
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Again')
+        self.assertEqual(
+            analytics.process('comments', now=self.later), 1
+        )
+        self.assertEqual(
+            self.rollup(post=self.post, author__isnull=True).comments, 2
+        )
+        self.assertEqual(EngagementRollup.objects.filter(
+            period=EngagementRollup.HOUR, post=self.post
+        ).get().comments, 2)
+
+    def test_folded_views_are_rolled_up(self):
+        for _ in range(3):
+            visits.increment(self.post.pk)
+        analytics.rollup()
+        self.assertEqual(
+            self.rollup(author=self.author, post__isnull=True).views, 3
+        )
+
+    def test_dashboard_only_for_author(self):
+        Like.objects.create(post=self.post, user=self.reader)
+        analytics.rollup(now=self.later)
+        url = reverse('author_analytics', args=['Greer'])
+        self.client.force_login(self.reader)
+        self.assertRedirects(self.client.get(url),
+                             reverse('profile', args=['Greer']))
+        self.client.force_login(self.author)
+        with self.assertNumQueries(6):
+            response = self.client.get(url + '?days=7')
+        self.assertEqual(len(response.context['daily_charts'][0][1]['bars']),
+                         7)
+        self.assertContains(response, 'Northern Lights')
+        self.assertEqual(response.context['top_posts'][0]['total_likes'], 1)
+        # Скрытая запись из списка пропадает, иначе ссылка вела бы на 404
+        Post.all_objects.filter(pk=self.post.pk).update(
+            deleted_at=timezone.now()
+        )
+        response = self.client.get(url + '?days=7')
+        self.assertEqual(list(response.context['top_posts']), [])
+
+
+class TestFollowLists(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Decima')
+        self.viewer = User.objects.create_user(username='Reese')
+        start = timezone.now() - timedelta(days=1)
+        self.fans = []
+        for n in range(7):
+            fan = User.objects.create_user(username=f'fan{n}')
+            # У части подписок одинаковое время - порядок решает id
+            Follow.objects.create(user=fan, author=self.author,
+                                  created=start + timedelta(minutes=n // 2))
+            self.fans.append(fan)
+        Follow.objects.create(user=self.viewer, author=self.fans[6])
+        Follow.objects.create(user=self.viewer, author=self.fans[1])
+
+    def test_keyset_pages_cover_all_rows(self):
+        url = reverse('followers', args=['Decima'])
+        self.client.force_login(self.viewer)
+        seen = []
+        cursor = None
+        with mock.patch('posts.views.FOLLOWS_PER_PAGE', 3):
+            while True:
+                response = self.client.get(
+                    url, {'cursor': cursor} if cursor else {}
+                )
+                page = response.context['page']
+                seen += [(user.username, user.is_followed)
+                         for user in response.context['users']]
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+        self.assertEqual(seen, [
+            (f'fan{n}', n in (1, 6)) for n in range(6, -1, -1)
+        ])
+
+    def test_no_offset_and_bad_cursor(self):
+        url = reverse('following', args=['Reese'])
+        self.client.force_login(self.viewer)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'fan6')
+        self.assertFalse(any('OFFSET' in query['sql']
+                             for query in queries.captured_queries))
+        # Испорченный курсор открывает первую страницу
+        response = self.client.get(url, {'cursor': 'garbage!'})
+        self.assertEqual(len(response.context['users']), 2)
+
+
+class TestAutocomplete(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in autocomplete.INDEXES.values():
+            index.reset()
+        for name in ('anna', 'Anton', 'boris'):
+            User.objects.create_user(username=name)
+        self.science = Group.objects.create(title='Наука и техника',
+                                            slug='science')
+        Group.objects.create(title='Техника', slug='tech')
+        self.url = reverse('autocomplete')
+
+    def search(self, q, kind='users'):
+        response = self.client.get(self.url, {'q': q, 'kind': kind})
+        return [result['text'] for result in response.json()['results']]
+
+    def test_prefix_without_database(self):
+        self.search('a')
+        self.search('a', 'groups')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('AN'), ['anna', 'Anton'])
+            self.assertEqual(self.search('тех', 'groups'),
+                             ['Наука и техника', 'Техника'])
+            self.assertEqual(self.search('', 'groups'), [])
+        response = self.client.get(self.url, {'q': 'a', 'kind': 'posts'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_signals_update_loaded_index(self):
+        self.search('a')
+        self.search('a', 'groups')
+        User.objects.create_user(username='annette')
+        self.science.title = 'Наука'
+        self.science.save()
+        User.objects.get(username='boris').delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('ann'), ['anna', 'annette'])
+            self.assertEqual(self.search('тех', 'groups'), ['Техника'])
+            self.assertEqual(self.search('b'), [])
+
+    def test_update_replaces_entries(self):
+        """Изменение не трогает список, который может читать поиск"""
+        self.search('a')
+        entries = autocomplete.users.entries
+        snapshot = list(entries)
+        User.objects.create_user(username='annette')
+        self.assertEqual(entries, snapshot)
+        self.assertIsNot(autocomplete.users.entries, entries)
+        self.assertEqual(self.search('ann'), ['anna', 'annette'])
+
+    def test_other_process_change_reloads(self):
+        index = autocomplete.users
+        index.search('a')
+        # Другой процесс изменил данные и версию в кэше
+        User.objects.filter(username='boris').update(username='bob')
+        cache.set(index.version_key, 100, None)
+        with override_settings(AUTOCOMPLETE_CHECK_INTERVAL=0):
+            self.assertEqual(index.search('b'), [(
+                User.objects.get(username='bob').pk, 'bob'
+            )])
+
+    def test_login_and_unchanged_saves_keep_version(self):
+        index = autocomplete.users
+        index.search('a')
+        version = cache.get(index.version_key, 0)
+        user = User.objects.get(username='anna')
+        user.set_password('secret-pass')
+        user.save()
+        self.assertTrue(Client().login(username='anna',
+                                       password='secret-pass'))
+        self.assertEqual(cache.get(index.version_key, 0), version)
+
+    def test_missed_bump_forces_reload(self):
+        index = autocomplete.users
+        index.search('a')
+        # Другой процесс переименовал пользователя и увеличил версию
+        User.objects.filter(username='boris').update(username='bob')
+        cache.incr(index.version_key)
+        User.objects.create_user(username='bella')
+        self.assertIsNone(index.version)
+        self.assertEqual([name for _, name in index.search('b')],
+                         ['bella', 'bob'])
+
+    def test_post_form_does_not_list_groups(self):
+        user = User.objects.create_user(username='writer')
+        self.client.force_login(user)
+        response = self.client.get(reverse('new_post'))
+        self.assertContains(response, 'data-autocomplete-url')
+        self.assertNotContains(response, '<option')
+        post = Post.objects.create(text='x', author=user, group=self.science)
+        response = self.client.get(
+            reverse('post_edit', args=['writer', post.pk])
+        )
+        self.assertContains(response, 'value="Наука и техника"')
+        response = self.client.post(
+            reverse('post_edit', args=['writer', post.pk]),
+            {'text': 'y', 'group': ''}
+        )
+        post.refresh_from_db()
+        self.assertIsNone(post.group)
+
+
+class TestHashtags(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Tagger')
+
+    def names(self, post):
+        return sorted(post.post_tags.values_list('tag__name', flat=True))
+
+    def test_parsed_on_save(self):
+        post = Post.objects.create(
+            text='Про #Django и #python, снова #django. Не теги: a#b #2020 '
+                 "&#x27;",
+            author=self.author
+        )
+        self.assertEqual(self.names(post), ['django', 'python'])
+        self.assertIn(
+            f'<a href="{reverse("tag", args=["django"])}">#Django</a>',
+            post.text_html
+        )
+        self.client.force_login(self.author)
+        self.client.post(
+            reverse('post_edit', args=['Tagger', post.pk]),
+            {'text': '#python и #Тесты'}
+        )
+        self.assertEqual(self.names(post), ['python', 'тесты'])
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_links_only_real_tags(self):
+        post = Post.objects.create(
+            text='#whole ' + 'x' * 283 + ' #partialtag и a&#fake #cut',
+            author=self.author
+        )
+        self.assertEqual(self.names(post), ['cut', 'partialtag', 'whole'])
+        self.assertIn('a&amp;#fake', post.text_html)
+        self.assertIn(reverse('tag', args=['partialtag']), post.text_html)
+        self.assertTrue(post.excerpt_html.endswith('#partial…'))
+        self.assertIn(reverse('tag', args=['whole']), post.excerpt_html)
+        self.assertNotIn(reverse('tag', args=['partial']), post.excerpt_html)
+        # Решётка после "&" в исходном тексте не тег, даже если такой тег
+        # есть в записи
+        post.text = 'a&#cut #cut'
+        post.save()
+        self.assertEqual(post.text_html.count('<a '), 1)
+
+    def test_backfill_streams_batches(self):
+        posts = [Post.objects.create(text=f'#t{n} #all', author=self.author)
+                 for n in range(5)]
+        PostTag.objects.all().delete()
+        out = io.StringIO()
+        call_command('backfill_tags', '--batch-size', '2', stdout=out)
+        self.assertIn(f'Обработано записей: 5, последний ключ: '
+                      f'{posts[-1].pk}', out.getvalue())
+        self.assertEqual(
+            PostTag.objects.filter(tag__name='all').count(), 5
+        )
+        self.assertEqual(self.names(posts[3]), ['all', 't3'])
+
+    def test_feed_pages_by_cursor(self):
+        for n in range(5):
+            Post.objects.create(text=f'{n} #feed', author=self.author)
+        Post.objects.create(text='#feed', author=self.author,
+                            deleted_at=timezone.now())
+        url = reverse('tag', args=['FEED'])
+        seen = []
+        cursor = None
+        with mock.patch('posts.views.TAG_POSTS_PER_PAGE', 2):
+            while True:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, {'cursor': cursor} if cursor else {}
+                    )
+                self.assertFalse(any(
+                    'OFFSET' in query['sql'] or 'LIKE' in query['sql']
+                    for query in queries.captured_queries
+                ))
+                seen += [post.text for post in response.context['posts']]
+                page = response.context['page']
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+        self.assertEqual(seen, [f'{n} #feed' for n in range(4, -1, -1)])
+        self.assertEqual(
+            self.client.get(reverse('tag', args=['nope'])).status_code, 404
+        )
+
+
+class TestMentions(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Writer')
+        self.users = [User.objects.create_user(username=f'user.{n}')
+                      for n in range(20)]
+
+    def mentioned(self, **lookup):
+        return sorted(Mention.objects.filter(**lookup).values_list(
+            'user__username', flat=True
+        ))
+
+    def test_post_mentions_resolved_in_one_query(self):
+        text = ' '.join(f'@user.{n}' for n in range(20)) + \
+            ' @ghost mail@user.1 @Writer.'
+        with CaptureQueriesContext(connection) as queries:
+            post = Post.objects.create(text=text, author=self.author)
+        self.assertEqual(sum(
+            'FROM "auth_user"' in query['sql']
+            for query in queries.captured_queries
+        ), 1)
+        self.assertEqual(
+            len(self.mentioned(post=post, comment__isnull=True)), 21
+        )
+        self.assertIn(
+            f'<a href="{reverse("profile", args=["Writer"])}">@Writer</a>.',
+            post.text_html
+        )
+        self.assertIn('@ghost mail@user.1', post.text_html)
+        post.text = '@user.3'
+        post.save()
+        self.assertEqual(self.mentioned(post=post), ['user.3'])
+
+    def test_comment_mentions_and_feed_without_queries(self):
+        post = Post.objects.create(text='@user.0 привет', author=self.author)
+        self.client.force_login(self.users[1])
+        self.client.post(reverse('add_comment', args=['Writer', post.pk]),
+                         {'text': 'Согласен с @user.0 и @Writer'})
+        comment = Comment.objects.get()
+        self.assertEqual(self.mentioned(comment=comment),
+                         ['Writer', 'user.0'])
+        self.assertEqual(self.mentioned(user__username='user.0'),
+                         ['user.0', 'user.0'])
+        response = self.client.get(reverse('post', args=['Writer', post.pk]))
+        profile = reverse('profile', args=['user.0'])
+        self.assertContains(response, f'<a href="{profile}">@user.0</a>',
+                            count=2)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse(any(
+            'username" IN' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_backfill_resolves_batch_at_once(self):
+        posts = [Post.objects.create(text=f'@user.{n}', author=self.author)
+                 for n in range(6)]
+        Post.objects.update(text_html='')
+        Mention.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('backfill_post_html', '--batch-size', '3',
+                         stdout=io.StringIO())
+        self.assertEqual(sum(
+            'FROM "auth_user"' in query['sql']
+            for query in queries.captured_queries
+        ), 2)
+        self.assertEqual(self.mentioned(post=posts[4]), ['user.4'])
+        posts[4].refresh_from_db()
+        self.assertIn('>@user.4</a>', posts[4].text_html)
+
+    def test_user_changes_rerender_links(self):
+        post = Post.objects.create(text='@user.0 и @newbie',
+                                   author=self.author)
+        comment = Comment.objects.create(post=post, author=self.author,
+                                         text='@user.0!')
+        old = reverse('profile', args=['user.0'])
+        newbie = reverse('profile', args=['newbie'])
+
+        def html():
+            jobs.run_pending()
+            post.refresh_from_db()
+            comment.refresh_from_db()
+            return post.text_html + comment.text_html
+
+        user = self.users[0]
+        user.username = 'user.zero'
+        user.save()
+        self.assertNotIn(old, html())
+        self.assertEqual(self.mentioned(post=post), [])
+        user.username = 'user.0'
+        user.save()
+        self.assertEqual(html().count(old), 2)
+        user.is_active = False
+        user.save()
+        self.assertNotIn(old, html())
+        # Вход и регистрация тексты не просматривают
+        with CaptureQueriesContext(connection) as queries:
+            self.author.save(update_fields=['last_login'])
+            created = User.objects.create_user(username='newbie')
+        self.assertFalse(any(
+            'posts_post' in query['sql']
+            for query in queries.captured_queries
+        ))
+        self.assertFalse(Job.objects.filter(status=Job.QUEUED).exists())
+        self.assertNotIn(newbie, html())
+        created.is_active = False
+        created.save()
+        created.is_active = True
+        created.save()
+        self.assertIn(f'<a href="{newbie}">@newbie</a>', html())
+        self.assertEqual(self.mentioned(post=post, comment__isnull=True),
+                         ['newbie'])
+        created.delete()
+        self.assertNotIn(newbie, html())
+
+
+class TestUrlBuilder(TestCase):
+    ARGS = {
+        'group': ['cats'], 'group_archive': ['cats'],
+        'group_archive_month': ['cats', 2026, 3], 'tag': ['тег'],
+        'profile': ['user.name+1'], 'author_analytics': ['leo'],
+        'author_archive': ['leo'], 'author_archive_month': ['leo', 2026, 3],
+        'followers': ['leo'], 'following': ['leo'],
+        'profile_follow': ['leo'], 'profile_unfollow': ['leo'],
+        'post': ['Лев', 7], 'post_edit': ['leo', 7],
+        'post_delete': ['leo', 7], 'add_comment': ['leo', 7],
+        'new_like': ['leo', 7], 'dislike': ['leo', 7],
+    }
+
+    def test_matches_reverse(self):
+        self.assertTrue(urlbuilder.builder.get_routes())
+        for name in urlbuilder.builder.names:
+            args = self.ARGS.get(name, [])
+            self.assertEqual(urlbuilder.build(name, *args),
+                             reverse(name, args=args), name)
+        set_script_prefix('/мой сайт/')
+        try:
+            self.assertEqual(urlbuilder.build('post', 'leo', 7),
+                             reverse('post', args=['leo', 7]))
+        finally:
+            clear_script_prefix()
+
+    def test_bad_arguments(self):
+        for name, args in (('profile', ['a/b']), ('profile', ['']),
+                           ('post', ['leo', 'x']), ('post', ['leo', 7, 1]),
+                           ('group', ['котики'])):
+            with self.assertRaises(NoReverseMatch):
+                urlbuilder.build(name, *args)
+
+    def test_card_links(self):
+        author = User.objects.create_user(username='leo')
+        group = Group.objects.create(title='Кошки', slug='cats')
+        post = Post.objects.create(text='x', author=author, group=group)
+        self.client.force_login(author)
+        response = self.client.get(reverse('profile', args=['leo']))
+        for name in ('post_edit', 'post_delete', 'add_comment', 'new_like'):
+            self.assertContains(response, reverse(name, args=['leo', post.pk]))
+        self.assertContains(
+            response, f'href="{reverse("group", args=["cats"])}"'
+        )
@@ -0,0 +1,166 @@
+"""Предварительная отрисовка текста записей.
+
+HTML текста и сокращённой версии для ленты вычисляются один раз при
+сохранении записи, а шаблон карточки выводит уже готовые строки.
+Хэштеги в них сразу становятся ссылками на ленту тега, а упоминания
+``@username`` существующих пользователей - ссылками на профиль. Так же
+отрисовывается текст комментариев. Все упомянутые имена разрешаются одним
+запросом на запись, а при пакетной отрисовке - одним на порцию.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils.html import escape, linebreaks
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator, normalize_newlines
+
+EXCERPT_LENGTH = 300
+# Тег - слово после решётки, в котором есть хотя бы одна буква. Решётка
+# внутри слова или после "&" (экранированные символы вроде "&#x27;")
+# тегом не считается
+TAG_RE = re.compile(r'(?<![\w&#])#(\w*[^\W\d_]\w*)')
+TAG_MAX_LENGTH = 100
+# Имя пользователя после "@", не внутри слова или адреса почты. Точка в
+# конце - конец предложения, а не часть имени
+MENTION_RE = re.compile(r'(?<![\w@.+-])@([\w.+-]*\w)')
+
+
+def render_html(text):
+    """То же, что фильтр ``linebreaksbr`` с автоэкранированием."""
+    return mark_safe(
+        normalize_newlines(escape(text)).replace('\n', '<br>')
+    )
+
+
+def render_excerpt(text):
+    """Сокращённый HTML для ленты или пустая строка, если текст и так
+    короткий."""
+    if len(text) <= EXCERPT_LENGTH:
+        return ''
+    return render_html(Truncator(text).chars(EXCERPT_LENGTH))
+
+
+def extract_tags(text):
+    """Теги текста в нижнем регистре, без повторов, в порядке появления."""
+    return list(dict.fromkeys(
+        name.casefold() for name in TAG_RE.findall(text)
+        if len(name) <= TAG_MAX_LENGTH
+    ))
+
+
+def link_tags(html, names, truncated=False):
+    """Ссылки на ленты тегов из ``names`` - результата ``extract_tags``
+    по исходному тексту. После экранирования "&#тег" становится
+    "&amp;#тег" и выглядит как тег, которого в тексте нет. В сокращённом
+    тексте (``truncated``) тег перед многоточием мог быть обрезан, и он
+    ссылкой не становится."""
+    names = set(names)
+
+    def link(match):
+        name = match.group(1)
+        if (name.casefold() not in names
+                or html.endswith('&amp;', 0, match.start())):
+            return match.group(0)
+        if truncated and not html[match.end():].strip('…'):
+            return match.group(0)
+        url = reverse('tag', args=[name.casefold()])
+        return f'<a href="{escape(url)}">#{name}</a>'
+
+    return mark_safe(TAG_RE.sub(link, html))
+
+
+def extract_mentions(text):
+    """Упомянутые имена без повторов, в порядке появления."""
+    return list(dict.fromkeys(MENTION_RE.findall(text)))
+
+
+def resolve_mentions(names, user_model=None):
+    """Словарь имя -> id для тех ``names``, что принадлежат активным
+    пользователям, одним запросом."""
+    if not names:
+        return {}
+    user_model = user_model or get_user_model()
+    return dict(user_model._base_manager.filter(
+        username__in=set(names), is_active=True
+    ).values_list('username', 'pk'))
+
+
+def link_mentions(html, users):
+    def link(match):
+        name = match.group(1)
+        if name not in users:
+            return match.group(0)
+        url = reverse('profile', args=[name])
+        return f'<a href="{escape(url)}">@{name}</a>'
+
+    return mark_safe(MENTION_RE.sub(link, html))
+
+
+def mentioned(text, users=None):
+    """Упомянутые в ``text`` пользователи из уже разрешённых ``users``
+    или, если их нет, выбранные запросом."""
+    names = extract_mentions(text)
+    if users is None:
+        return resolve_mentions(names)
+    return {name: users[name] for name in names if name in users}
+
+
+def render_post(post, users=None):
+    """Заполняет HTML записи. ``users`` - уже разрешённые упоминания,
+    иначе они выбираются здесь; упомянутые остаются в ``post._mentioned``."""
+    post._mentioned = mentioned(post.text, users)
+    names = extract_tags(post.text)
+    post.text_html = link_tags(
+        link_mentions(render_html(post.text), post._mentioned), names
+    )
+    post.excerpt_html = link_tags(
+        link_mentions(render_excerpt(post.text), post._mentioned), names,
+        truncated=True
+    )
+
+
+def render_comment(comment, users=None):
+    comment._mentioned = mentioned(comment.text, users)
+    comment.text_html = link_mentions(
+        render_html(comment.text), comment._mentioned
+    )
+
+
+# Функция отрисовки, заполняемые и нужные для неё поля
+RENDERERS = {
+    'post': (render_post, ['text_html', 'excerpt_html'], ['text']),
+    'comment': (render_comment, ['text_html'], ['text', 'post']),
+}
+
+
+def backfill(model, batch_size=500, only_missing=True, condition=None):
+    """Заполняет отрисованный текст у существующих записей или
+    комментариев порциями по первичному ключу и обновляет таблицу
+    упоминаний. ``condition`` - необязательное Q-условие отбора. Имена
+    упомянутых пользователей разрешаются одним запросом на порцию."""
+    from .mentions import sync
+
+    render, fields, loaded = RENDERERS[model._meta.model_name]
+    queryset = model._base_manager.order_by('pk')
+    if only_missing:
+        queryset = queryset.filter(text_html='')
+    if condition is not None:
+        queryset = queryset.filter(condition)
+    last_pk = 0
+    total = 0
+    while True:
+        objects = list(
+            queryset.filter(pk__gt=last_pk).only('pk', *loaded)[:batch_size]
+        )
+        if not objects:
+            return total
+        users = resolve_mentions([
+            name for obj in objects for name in extract_mentions(obj.text)
+        ])
+        for obj in objects:
+            render(obj, users)
+        model._base_manager.bulk_update(objects, fields)
+        sync(objects)
+        last_pk = objects[-1].pk
+        total += len(objects)
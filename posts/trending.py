@@ -0,0 +1,130 @@
+"""Популярные записи.
+
+Рейтинг поста - сумма весов событий (лайков, комментариев, просмотров),
+каждое из которых затухает экспоненциально с периодом полураспада
+``TRENDING_HALF_LIFE`` секунд.
+
+Чтобы событие учитывалось одним атомарным запросом без чтения строки,
+рейтинг хранится не затухшим, а приведённым к началу текущей эпохи
+(``updated``): вес события в момент ``t`` умножается на
+``2 ** ((t - начало эпохи) / HALF_LIFE)``, а текущее значение получается
+обратным затуханием. Эпохи длятся ``REBASE_HALF_LIVES`` периодов
+полураспада, иначе множитель вышел бы за пределы float. Первое событие
+новой эпохи переводит строку в неё: значение прошлой эпохи уменьшается на
+постоянный множитель, а более старые уже затухли и отбрасываются.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PostScore
+
+HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE', 24 * 60 * 60)
+WEIGHTS = getattr(settings, 'TRENDING_WEIGHTS', {
+    'like': 3.0,
+    'comment': 5.0,
+    'visit': 0.2,
+})
+TOP_SIZE = getattr(settings, 'TRENDING_TOP_SIZE', 100)
+MIN_SCORE = getattr(settings, 'TRENDING_MIN_SCORE', 0.01)
+CACHE_KEY = 'trending:top'
+CACHE_TIMEOUT = getattr(settings, 'TRENDING_CACHE_TIMEOUT', 60 * 60)
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+REBASE_HALF_LIVES = 30
+# За эпоху рейтинг затухает в 2 ** 30 раз
+EPOCH_LENGTH = int(HALF_LIFE * REBASE_HALF_LIVES)
+
+
+def decay(score, since, now):
+    """Приводит рейтинг, посчитанный на момент ``since``, к моменту
+    ``now``."""
+    elapsed = max((now - since).total_seconds(), 0)
+    return score * 0.5 ** (elapsed / HALF_LIFE)
+
+
+def epoch_start(now):
+    elapsed = int((now - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=elapsed - elapsed % EPOCH_LENGTH)
+
+
+def bump(post_id, event, now=None):
+    """Учитывает событие ``event`` (ключ ``TRENDING_WEIGHTS``) в рейтинге
+    поста одним запросом INSERT ... ON CONFLICT."""
+    now = now or timezone.now()
+    start = epoch_start(now)
+    previous = start - timedelta(seconds=EPOCH_LENGTH)
+    weight = WEIGHTS[event] * 2 ** (
+        (now - start).total_seconds() / HALF_LIFE
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+    table = connection.ops.quote_name(PostScore._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (post_id, score, updated) '
+            f'VALUES (%s, %s, %s) '
+            f'ON CONFLICT (post_id) DO UPDATE SET '
+            f'score = CASE WHEN {table}.updated = %s THEN {table}.score '
+            f'WHEN {table}.updated = %s THEN {table}.score * %s '
+            f'ELSE 0 END + excluded.score, '
+            f'updated = excluded.updated',
+            [post_id, weight, adapt(start), adapt(start), adapt(previous),
+             0.5 ** REBASE_HALF_LIVES]
+        )
+
+
+def refresh(now=None):
+    """Удаляет затухшие рейтинги и обновляет кэш с идентификаторами лучших
+    постов. Рейтинги не переписываются, поэтому пересчёт не спорит с
+    параллельными событиями.
+
+    Возвращает пару (осталось, удалено)."""
+    now = now or timezone.now()
+    start = epoch_start(now)
+    previous = start - timedelta(seconds=EPOCH_LENGTH)
+    # Порог для каждой эпохи - MIN_SCORE, приведённый к её началу
+    stale = Q(updated__lt=previous) | Q(
+        updated=start, score__lt=MIN_SCORE / decay(1, start, now)
+    ) | Q(
+        updated=previous, score__lt=MIN_SCORE / decay(1, previous, now)
+    )
+    removed, _ = PostScore.objects.filter(stale).delete()
+    ids = top_ids(now)
+    cache.set(CACHE_KEY, ids, CACHE_TIMEOUT)
+    return PostScore.objects.count(), removed
+
+
+def top_ids(now=None):
+    """Лучшие посты на момент ``now``. Внутри эпохи порядок приведённых
+    рейтингов совпадает с порядком текущих, поэтому лучшие строки текущей
+    и прошлой эпох читаются по индексу (updated, -score), а сливаются
+    здесь. Строки старше прошлой эпохи затухли."""
+    now = now or timezone.now()
+    start = epoch_start(now)
+    previous = start - timedelta(seconds=EPOCH_LENGTH)
+    rows = []
+    for updated, factor in ((start, 1.0),
+                            (previous, 0.5 ** REBASE_HALF_LIVES)):
+        rows += [
+            (-score * factor, post_id)
+            for post_id, score in PostScore.objects.filter(
+                updated=updated
+            ).order_by('-score', 'post_id').values_list(
+                'post_id', 'score'
+            )[:TOP_SIZE]
+        ]
+    rows.sort()
+    return [post_id for _, post_id in rows[:TOP_SIZE]]
+
+
+def top_post_ids():
+    """Идентификаторы лучших постов, по убыванию рейтинга."""
+    ids = cache.get(CACHE_KEY)
+    if ids is None:
+        # Кэш ещё не прогрет командой refresh_trending
+        ids = top_ids()
+        cache.set(CACHE_KEY, ids, CACHE_TIMEOUT)
+    return ids
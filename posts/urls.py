@@ -4,10 +4,53 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('group/', views.group_index, name='group_index'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
+    path(
+        'group/<slug:slug>/archive/',
+        views.group_archive,
+        name='group_archive'
+    ),
+    path(
+        'group/<slug:slug>/archive/<int:year>/<int:month>/',
+        views.group_archive_month,
+        name='group_archive_month'
+    ),
+    path('tag/<str:name>/', views.tag_posts, name='tag'),
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('trending/', views.trending_index, name='trending'),
+    path(
+        'autocomplete/',
+        views.autocomplete_search,
+        name='autocomplete'
+    ),
     path('<str:username>/', views.profile, name='profile'),
+    path(
+        '<str:username>/analytics/',
+        views.author_analytics,
+        name='author_analytics'
+    ),
+    path(
+        '<str:username>/archive/',
+        views.author_archive,
+        name='author_archive'
+    ),
+    path(
+        '<str:username>/archive/<int:year>/<int:month>/',
+        views.author_archive_month,
+        name='author_archive_month'
+    ),
+    path(
+        '<str:username>/followers/',
+        views.followers,
+        name='followers'
+    ),
+    path(
+        '<str:username>/following/',
+        views.following,
+        name='following'
+    ),
     path(
         '<str:username>/follow/',
         views.profile_follow,
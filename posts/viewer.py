@@ -0,0 +1,55 @@
+from .models import Follow, Like
+
+
+def attach_viewer_state(posts, user):
+    """Проставляет постам состояние для текущего пользователя.
+
+    Для страницы постов выполняется ровно два запроса с ``IN``: лайки
+    пользователя к этим постам и его подписки на их авторов. Результат
+    сохраняется в атрибутах ``is_liked`` и ``is_following`` каждого поста,
+    поэтому шаблоны карточек больше не делают запросов на каждый пост.
+    Возвращает список постов.
+    """
+    posts = list(posts)
+    liked = following = set()
+    if user.is_authenticated and posts:
+        liked = set(
+            Like.objects.filter(
+                user=user,
+                post_id__in={post.pk for post in posts}
+            ).values_list('post_id', flat=True)
+        )
+        following = set(
+            Follow.objects.filter(
+                user=user,
+                author_id__in={post.author_id for post in posts}
+            ).values_list('author_id', flat=True)
+        )
+    for post in posts:
+        post.is_liked = post.pk in liked
+        post.is_following = post.author_id in following
+    return posts
+
+
+def attach_page_viewer_state(page, user):
+    """То же самое для страницы паджинатора: список постов подменяется
+    уже вычисленным, чтобы шаблон не выполнял выборку повторно."""
+    page.object_list = attach_viewer_state(page.object_list, user)
+    return page
+
+
+def attach_follow_state(users, user):
+    """Проставляет пользователям атрибут ``is_followed`` - подписан ли на
+    них ``user``, одним запросом с ``IN``. Возвращает список."""
+    users = list(users)
+    followed = set()
+    if user.is_authenticated and users:
+        followed = set(
+            Follow.objects.filter(
+                user=user,
+                author_id__in={other.pk for other in users}
+            ).values_list('author_id', flat=True)
+        )
+    for other in users:
+        other.is_followed = other.pk in followed
+    return users
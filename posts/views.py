@@ -1,14 +1,31 @@
+from datetime import timedelta
+
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.cache import cache_page
+from django.conf import settings
 from django.db.models import F
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from yatube import db_router
 
+from . import (analytics, archive, audience, autocomplete, jobs, tags,
+               trending, visits)
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, Like
+from .models import (Comment, EngagementRollup, Follow, Group, Post, Like,
+                     Tag)
+from .paginator import KeysetPaginator
+from .viewer import (attach_follow_state, attach_page_viewer_state,
+                     attach_viewer_state)
 
+COMMENTS_PER_PAGE = 50
+ANALYTICS_PERIODS = (7, 30, 90)
+FOLLOWS_PER_PAGE = 50
+TAG_POSTS_PER_PAGE = 10
 
 
 # @cache_page(20, cache='default', key_prefix='')
@@ -16,7 +33,9 @@ def index(request):
     latest = Post.objects.select_related('group', 'author').all()
     paginator = Paginator(latest, 10)
     page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = attach_page_viewer_state(
+        paginator.get_page(page_number), request.user
+    )
     # узнаем, подписан ли на кого-то залогиненный пользователь
     follow = request.user.is_authenticated and Follow.objects.filter(user=request.user)
     # likes = Like.objects.filter(post=latest).count()
@@ -30,20 +49,214 @@ def index(request):
     )
 
 
+def trending_index(request):
+    ids = trending.top_post_ids()
+    posts = Post.objects.select_related('group', 'author').in_bulk(ids)
+    latest = [posts[pk] for pk in ids if pk in posts]
+    paginator = Paginator(latest, 10)
+    page_number = request.GET.get('page')
+    page = attach_page_viewer_state(
+        paginator.get_page(page_number), request.user
+    )
+    return render(
+        request,
+        'trending.html',
+        {'page': page, 'paginator': paginator}
+    )
+
+
+def group_index(request):
+    groups = Group.objects.order_by(
+        F('last_post_at').desc(nulls_last=True), 'title'
+    )
+    paginator = Paginator(groups, 50)
+    page_number = request.GET.get('page')
+    page = paginator.get_page(page_number)
+    return render(
+        request,
+        'groups.html',
+        {'page': page, 'paginator': paginator}
+    )
+
+
+def autocomplete_search(request):
+    """Подсказки по началу имени пользователя (``kind=users``) или слова
+    в названии сообщества (``kind=groups``). Отвечает из индекса в памяти,
+    без запросов к базе."""
+    index = autocomplete.INDEXES.get(request.GET.get('kind', 'users'))
+    if index is None:
+        raise Http404
+    results = []
+    for pk, text in index.search(request.GET.get('q', '')):
+        result = {'id': pk, 'text': text}
+        if index is autocomplete.users:
+            result['url'] = reverse('profile', args=[text])
+        results.append(result)
+    return JsonResponse({'results': results})
+
+
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.select_related('author', 'group').all()
     paginator = Paginator(posts, 10)
     page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = attach_page_viewer_state(
+        paginator.get_page(page_number), request.user
+    )
     return render(request, 'group.html', {
         'group': group,
         'page': page,
-        'posts': posts,
         'paginator': paginator
     })
 
 
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag, name=name.casefold())
+    paginator = KeysetPaginator(
+        tags.feed(tag), ('pub_date', 'id'), TAG_POSTS_PER_PAGE
+    )
+    page = paginator.get_page(request.GET.get('cursor'))
+    posts = attach_viewer_state(
+        [post_tag.post for post_tag in page], request.user
+    )
+    return render(request, 'posts/tag.html', {
+        'tag': tag,
+        'page': page,
+        'posts': posts,
+    })
+
+
+def archive_months(request, owner, key, months, month_url):
+    return render(request, 'posts/archive.html', {
+        'owner': owner,
+        'key': key,
+        'months': months.filter(post_count__gt=0),
+        'month_url': month_url,
+    })
+
+
+def archive_month(request, owner, key, posts, year, month, archive_url):
+    try:
+        start, end = archive.month_range(year, month)
+    except ValueError:
+        raise Http404
+    posts = posts.select_related('author', 'group').filter(
+        pub_date__gte=start, pub_date__lt=end
+    )
+    paginator = Paginator(posts, 10)
+    page_number = request.GET.get('page')
+    page = attach_page_viewer_state(
+        paginator.get_page(page_number), request.user
+    )
+    response = render(request, 'posts/archive_month.html', {
+        'owner': owner,
+        'key': key,
+        'archive_url': archive_url,
+        'month': start,
+        'page': page,
+        'paginator': paginator,
+    })
+    # Закончившийся месяц меняется только при правке старых записей
+    if end <= timezone.now():
+        patch_cache_control(
+            response,
+            max_age=getattr(settings, 'ARCHIVE_CACHE_TIMEOUT', 60 * 60),
+            **({'private': True} if request.user.is_authenticated
+               else {'public': True})
+        )
+    return response
+
+
+def author_archive(request, username):
+    author = get_object_or_404(User, username=username)
+    return archive_months(
+        request, author, username,
+        author.archive_months.filter(group__isnull=True),
+        'author_archive_month'
+    )
+
+
+def author_archive_month(request, username, year, month):
+    author = get_object_or_404(User, username=username)
+    return archive_month(
+        request, author, username, author.posts.all(), year, month,
+        'author_archive'
+    )
+
+
+def group_archive(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return archive_months(
+        request, group, slug,
+        group.archive_months.filter(author__isnull=True),
+        'group_archive_month'
+    )
+
+
+def group_archive_month(request, slug, year, month):
+    group = get_object_or_404(Group, slug=slug)
+    return archive_month(
+        request, group, slug, group.posts.all(), year, month,
+        'group_archive'
+    )
+
+
+@login_required
+def author_analytics(request, username):
+    """Статистика автора по готовым сводкам, без агрегации лайков и
+    комментариев."""
+    if request.user.username != username:
+        return redirect('profile', username)
+    author = request.user
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in ANALYTICS_PERIODS:
+        days = 30
+    now = timezone.now()
+    today = analytics.period_start(now, EngagementRollup.DAY)
+    since = today - timedelta(days=days - 1)
+    daily = analytics.series(
+        EngagementRollup.DAY, since, days,
+        author=author, post__isnull=True
+    )
+    hourly = analytics.series(
+        EngagementRollup.HOUR,
+        analytics.period_start(now, EngagementRollup.HOUR)
+        - timedelta(hours=47),
+        48, author=author, post__isnull=True
+    )
+    viewers = dict(audience.author_daily_viewers(
+        author, timezone.localtime(since).date()
+    ))
+    for point in daily:
+        point['viewers'] = viewers.get(
+            timezone.localtime(point['start']).date(), 0
+        )
+    return render(request, 'posts/analytics.html', {
+        'author': author,
+        'days': days,
+        'periods': ANALYTICS_PERIODS,
+        'daily_charts': [
+            ('Просмотры', analytics.chart(daily, 'views', '%d.%m')),
+            ('Уникальные зрители',
+             analytics.chart(daily, 'viewers', '%d.%m')),
+            ('Лайки', analytics.chart(daily, 'likes', '%d.%m')),
+            ('Комментарии', analytics.chart(daily, 'comments', '%d.%m')),
+        ],
+        'hourly_charts': [
+            ('Просмотры', analytics.chart(hourly, 'views', '%d.%m %H:00')),
+            ('Лайки', analytics.chart(hourly, 'likes', '%d.%m %H:00')),
+            ('Комментарии',
+             analytics.chart(hourly, 'comments', '%d.%m %H:00')),
+        ],
+        'top_posts': analytics.top_posts(
+            author, since, today + timedelta(days=1)
+        ),
+    })
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -78,17 +291,20 @@ def post_edit(request, username, post_id):
 
 def profile(request, username):
     user_profile = get_object_or_404(User, username=username)
-    posts = user_profile.posts.all()
+    posts = user_profile.posts.select_related('author', 'group').all()
     following = request.user.is_authenticated and Follow.objects.filter(
         author=user_profile,
         user=request.user
     ).exists()
     paginator = Paginator(posts, 10)
     page_num = request.GET.get('page')
-    page = paginator.get_page(page_num)
-    likes=0
-    for post in posts:
-        likes += Like.objects.filter(post=post).count()
+    page = attach_page_viewer_state(
+        paginator.get_page(page_num), request.user
+    )
+    # Один COUNT вместо запроса на каждую запись автора
+    likes = Like.objects.filter(
+        post__author=user_profile, post__deleted_at__isnull=True
+    ).count()
     return render(
         request,
         'posts/profile.html',
@@ -102,13 +318,33 @@ def profile(request, username):
     )
 
 
+def count_view(request, post_id, author_id=None):
+    """Учитывает просмотр записи в счётчике, зрителях и популярном."""
+    with db_router.bookkeeping():
+        visits.increment(post_id)
+        audience.record_view(post_id, audience.viewer_key(request),
+                             author_id=author_id)
+        trending.bump(post_id, 'visit')
+
+
+def post_cache_hit(request, username, post_id):
+    """Просмотр страницы записи, отданной из кэша, см.
+    PAGE_CACHE_HIT_HANDLERS."""
+    count_view(request, post_id)
+
+
 def post_view(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, pk=post_id)
-    post.visits += 1
-    post.save()
-    items = Comment.objects.filter(post_id=post_id)
+    count_view(request, post.pk, post.author_id)
+    items = Comment.objects.select_related('author').filter(
+        post_id=post_id
+    ).order_by('created', 'pk')
+    # Шаблон выводит комментарии постранично, а не загружает все сразу
+    comments_page = Paginator(items, COMMENTS_PER_PAGE).get_page(
+        request.GET.get('comments')
+    )
     form = CommentForm(instance=None)
-    is_liked = post.like.filter(user=request.user)
+    attach_viewer_state([post], request.user)
     likes = Like.objects.filter(post_id=post_id).count()
     return render(
         request,
@@ -116,19 +352,22 @@ def post_view(request, username, post_id):
         {
             'post': post,
             'author': post.author,
-            'items': items, 'form': form,
-            'is_liked': is_liked,
+            'items': items, 'comments_page': comments_page,
+            'form': form,
+            'is_liked': post.is_liked,
             'likes': likes
         }
     )
 
 @login_required
 def post_delete(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = Post.objects.get(pk=post_id)
-    if request.user != author:
+    post = get_object_or_404(Post, author__username=username, pk=post_id)
+    if request.user != post.author:
         return redirect("post", username=username, post_id=post_id)
-    post.delete()
+    post.deleted_at = timezone.now()
+    post.save(update_fields=['deleted_at'])
+    # Комментарии, лайки и сама запись удаляются фоновым обработчиком
+    jobs.enqueue('purge_deleted_posts', priority=-10, post_ids=[post.pk])
     return redirect("index")
 
 @login_required
@@ -149,12 +388,45 @@ def follow_index(request):
     paginator = Paginator(posts, 10)
     page_number = request.GET.get(
         'page')
-    page = paginator.get_page(
-        page_number)
+    page = attach_page_viewer_state(
+        paginator.get_page(page_number), request.user
+    )
     return render(request, 'follow.html',
                   {'page': page, 'paginator': paginator})
 
 
+def follow_list(request, author, follows, related, title):
+    paginator = KeysetPaginator(
+        follows.select_related(related), ('created', 'id'), FOLLOWS_PER_PAGE
+    )
+    page = paginator.get_page(request.GET.get('cursor'))
+    users = attach_follow_state(
+        [getattr(follow, related) for follow in page], request.user
+    )
+    return render(request, 'posts/follow_list.html', {
+        'author': author,
+        'title': title,
+        'page': page,
+        'users': users,
+    })
+
+
+def followers(request, username):
+    author = get_object_or_404(User, username=username)
+    return follow_list(
+        request, author, Follow.objects.filter(author=author), 'user',
+        'Подписчики'
+    )
+
+
+def following(request, username):
+    author = get_object_or_404(User, username=username)
+    return follow_list(
+        request, author, Follow.objects.filter(user=author), 'author',
+        'Подписки'
+    )
+
+
 @login_required
 def profile_follow(request, username):
     user = request.user
@@ -0,0 +1,73 @@
+"""Счётчик просмотров записей без конкуренции за строку ``Post``.
+
+Каждый просмотр увеличивает одну из ``VISIT_SHARDS`` строк ``VisitShard``
+записи, выбранную случайно, поэтому одновременные просмотры популярной
+записи обновляют разные строки. ``fold()`` периодически переносит
+накопленное в ``Post.visits``, которое и показывается на страницах, и в
+почасовую статистику ``posts.analytics``.
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import analytics
+from .models import Post, VisitShard
+
+SHARDS = getattr(settings, 'VISIT_SHARDS', 8)
+
+
+def increment(post_id, amount=1):
+    shard = random.randrange(SHARDS)
+    rows = VisitShard.objects.filter(post_id=post_id, shard=shard)
+    if rows.update(count=F('count') + amount):
+        return
+    try:
+        with transaction.atomic():
+            VisitShard.objects.create(post_id=post_id, shard=shard,
+                                      count=amount)
+    except IntegrityError:
+        # Строку успели создать параллельно
+        rows.update(count=F('count') + amount)
+
+
+def pending(post_id):
+    """Просмотры, ещё не перенесённые в ``Post.visits``."""
+    return sum(VisitShard.objects.filter(post_id=post_id).values_list(
+        'count', flat=True
+    ))
+
+
+def fold(batch_size=500):
+    """Переносит накопленные просмотры в ``Post.visits``. Из частей
+    вычитается ровно прочитанное, поэтому просмотры, пришедшие во время
+    переноса, не теряются. Возвращает число обновлённых записей."""
+    shards = VisitShard.objects.filter(count__gt=0).order_by('post_id')
+    folded = 0
+    last_id = 0
+    while True:
+        post_ids = list(shards.filter(post_id__gt=last_id).values_list(
+            'post_id', flat=True
+        ).distinct()[:batch_size])
+        if not post_ids:
+            break
+        rows = shards.filter(post_id__in=post_ids).values_list(
+            'pk', 'post_id', 'count'
+        )
+        totals = {}
+        with transaction.atomic():
+            for pk, post_id, count in rows:
+                VisitShard.objects.filter(pk=pk).update(
+                    count=F('count') - count
+                )
+                totals[post_id] = totals.get(post_id, 0) + count
+            for post_id, total in totals.items():
+                Post.all_objects.filter(pk=post_id).update(
+                    visits=F('visits') + total
+                )
+            analytics.add_views(totals)
+        folded += len(totals)
+        last_id = post_ids[-1]
+    VisitShard.objects.filter(count=0).delete()
+    return folded
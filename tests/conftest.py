@@ -1,4 +1,19 @@
+import shutil
+import tempfile
+
+import pytest
+from django.test import override_settings
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def media_root():
+    # Загруженные в тестах картинки не должны попадать в media/ проекта
+    root = tempfile.mkdtemp()
+    with override_settings(MEDIA_ROOT=root):
+        yield root
+    shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,119 @@
+"""Маршрутизация запросов к реплике базы данных.
+
+Чтение моделей ленты и профиля (приложения из ``REPLICA_APPS``) в рамках
+безопасных HTTP-запросов уходит на реплику ``REPLICA_DATABASE``, всё
+остальное - на основную базу. Как только запрос что-то записал, остаток
+запроса и последующие запросы этого браузера в течение
+``REPLICA_PIN_SECONDS`` читают из основной базы, чтобы пользователь сразу
+видел свои записи, комментарии, лайки и подписки.
+
+Без реплики записи не отслеживаются и cookie не ставится. Служебные записи
+самого представления (счётчики просмотров, рейтинг) делаются внутри
+``bookkeeping()`` и за действия пользователя не считаются. Чтение внутри
+блока идёт с основной базы: служебные записи сравнивают прочитанное с
+текущим значением, и отставшая реплика сорвала бы такое сравнение.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import signing
+
+PIN_COOKIE = 'pin_primary'
+PIN_SALT = 'yatube.db_router'
+
+_state = threading.local()
+
+
+def replica_alias():
+    return getattr(settings, 'REPLICA_DATABASE', None)
+
+
+def _routed(model):
+    return model._meta.app_label in getattr(
+        settings, 'REPLICA_APPS', ('posts', 'auth')
+    )
+
+
+def use_replica(enabled):
+    """Разрешает (или запрещает) чтение с реплики в текущем потоке."""
+    _state.use_replica = enabled
+    _state.wrote = False
+
+
+@contextmanager
+def bookkeeping():
+    """Записи внутри блока не закрепляют браузер за основной базой, а
+    чтение идёт с неё."""
+    previous = getattr(_state, 'bookkeeping', False)
+    _state.bookkeeping = True
+    try:
+        yield
+    finally:
+        _state.bookkeeping = previous
+
+
+def wrote():
+    """Была ли в текущем запросе запись в маршрутизируемые модели."""
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if (alias and getattr(_state, 'use_replica', False)
+                and not wrote() and _routed(model)
+                and not getattr(_state, 'bookkeeping', False)):
+            return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        if (replica_alias() and _routed(model)
+                and not getattr(_state, 'bookkeeping', False)):
+            _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != replica_alias()
+
+
+class ReplicaPinningMiddleware:
+    """Включает чтение с реплики для GET/HEAD и закрепляет браузер за
+    основной базой после записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_pinned(self, request):
+        value = request.COOKIES.get(PIN_COOKIE)
+        if not value:
+            return False
+        try:
+            until = signing.loads(value, salt=PIN_SALT)
+        except signing.BadSignature:
+            return False
+        return until > time.time()
+
+    def __call__(self, request):
+        use_replica(
+            request.method in ('GET', 'HEAD')
+            and not self.is_pinned(request)
+        )
+        try:
+            response = self.get_response(request)
+            if replica_alias() and wrote():
+                seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+                response.set_cookie(
+                    PIN_COOKIE,
+                    signing.dumps(time.time() + seconds, salt=PIN_SALT),
+                    max_age=seconds,
+                    httponly=True
+                )
+        finally:
+            use_replica(False)
+        return response
@@ -0,0 +1,115 @@
+"""Кэш целых страниц для анонимных посетителей.
+
+Middleware стоит первой в ``MIDDLEWARE``: запрос без cookie сессии ищется в
+кэше по пути и параметрам и при попадании возвращается сразу, минуя
+сессии, аутентификацию, CSRF и сообщения. Ключ включает номер версии
+содержимого, который увеличивается при любом изменении моделей из
+``PAGE_CACHE_MODELS``, поэтому устаревшие страницы просто перестают
+находиться в кэше.
+
+Ответ из кэша не проходит через представление, поэтому его побочные
+действия (учёт просмотра записи) выполняет обработчик из
+``PAGE_CACHE_HIT_HANDLERS``: ``handler(request, **kwargs)`` с аргументами
+маршрута закэшированной страницы. Сохранение
+пользователя только с ``last_login`` (при каждом входе) содержимое страниц
+не меняет и версию не увеличивает.
+
+Версия хранится в кэше ``PAGE_CACHE``. С ``LocMemCache`` у каждого
+процесса свои страницы и своя версия, и изменение, сделанное в одном
+процессе, не сбрасывает страницы в других: они остаются устаревшими до
+``PAGE_CACHE_TIMEOUT``. При нескольких процессах нужен общий кэш
+(Memcached, Redis).
+"""
+import hashlib
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.utils.module_loading import import_string
+
+VERSION_KEY = 'page_cache:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE', 'default')]
+
+
+def content_version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+# Поля, изменение которых не видно на кэшируемых страницах
+IGNORED_UPDATES = (frozenset({'last_login'}),)
+
+
+def bump_version(update_fields=None, **kwargs):
+    if update_fields is not None and frozenset(update_fields) in \
+            IGNORED_UPDATES:
+        return
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, None)
+
+
+def connect_signals():
+    for label in getattr(settings, 'PAGE_CACHE_MODELS', ()):
+        model = apps.get_model(label)
+        post_save.connect(bump_version, sender=model,
+                          dispatch_uid=f'page_cache_save_{label}')
+        post_delete.connect(bump_version, sender=model,
+                            dispatch_uid=f'page_cache_delete_{label}')
+
+
+class AnonymousPageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = frozenset(getattr(settings, 'PAGE_CACHE_VIEWS', ()))
+        self.timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 5 * 60)
+        self.hit_handlers = {
+            name: import_string(path) for name, path in getattr(
+                settings, 'PAGE_CACHE_HIT_HANDLERS', {}
+            ).items()
+        }
+
+    def __call__(self, request):
+        if (request.method != 'GET'
+                or settings.SESSION_COOKIE_NAME in request.COOKIES):
+            return self.get_response(request)
+        cache = get_cache()
+        key = 'page_cache:{}:{}'.format(
+            content_version(cache),
+            hashlib.md5(request.get_full_path().encode()).hexdigest()
+        )
+        response = cache.get(key)
+        if response is not None:
+            view = getattr(response, 'page_cache_view', None)
+            if view is not None and view[0] in self.hit_handlers:
+                self.hit_handlers[view[0]](request, **view[1])
+            return response
+        response = self.get_response(request)
+        if self.storable(request, response):
+            # Маршрут сохраняется вместе с ответом для обработчика попадания
+            match = request.resolver_match
+            response.page_cache_view = (match.url_name, match.kwargs)
+            cache.set(key, response, self.timeout)
+        return response
+
+    def storable(self, request, response):
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        return (
+            not settings.DEBUG
+            and match is not None and match.url_name in self.views
+            and response.status_code == 200
+            and not response.streaming
+            # Страница, выставившая cookie (сессия, CSRF), персональна
+            and not response.cookies
+            and (user is None or not user.is_authenticated)
+        )
@@ -0,0 +1,113 @@
+"""Ограничение частоты запросов к пишущим страницам.
+
+Лимиты задаются в ``RATELIMITS`` по имени URL: ``'new_post': '10/m'``
+значит 10 запросов в минуту с возможностью сделать их подряд. Считаются
+только запросы, которые что-то меняют: POST и прочие небезопасные методы,
+а GET - лишь для представлений из ``RATELIMIT_GET_VIEWS``, пишущих по
+ссылке (лайки, подписки). Показ формы лимит не расходует.
+
+Вошедший пользователь имеет собственное ведро; ведро IP-адреса
+используется для анонимных запросов, а для вошедших - только при
+``RATELIMIT_AUTHENTICATED_IP``. За прокси ``REMOTE_ADDR`` у всех один,
+поэтому адрес клиента берётся из заголовка ``RATELIMIT_IP_HEADER``
+(например ``HTTP_X_FORWARDED_FOR``), но только если запрос пришёл от
+прокси из ``RATELIMIT_TRUSTED_PROXIES``.
+Состояние ведра - одно число в кэше, теоретическое время прихода
+следующего запроса (алгоритм GCRA). Оно меняется атомарным ``incr``,
+поэтому проверка стоит пару обращений к кэшу и не требует блокировок.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60000): количество и период в миллисекундах."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period] * 1000
+
+
+def hit(cache, key, rate, now=None):
+    """Забирает токен из ведра ``key``. Возвращает ``None``, если запрос
+    разрешён, иначе - сколько секунд ждать следующего токена."""
+    count, period = parse_rate(rate)
+    interval = max(period // count, 1)
+    burst = count * interval
+    now = int((now if now is not None else time.time()) * 1000)
+    timeout = math.ceil(burst / 1000) + 1
+    cache.add(key, now, timeout)
+    try:
+        tat = cache.incr(key, interval)
+    except ValueError:
+        # Ключ успел истечь между add и incr
+        cache.set(key, now + interval, timeout)
+        return None
+    if tat - interval < now:
+        # Ведро простаивало и полностью наполнилось
+        tat = now + interval
+        cache.set(key, tat, timeout)
+    if tat - now > burst:
+        cache.decr(key, interval)
+        return (tat - now - burst) / 1000
+    cache.touch(key, timeout)
+    return None
+
+
+def client_ip(request):
+    """Адрес клиента с учётом доверенных прокси."""
+    remote = request.META.get('REMOTE_ADDR')
+    header = getattr(settings, 'RATELIMIT_IP_HEADER', None)
+    trusted = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', ())
+    if not header or remote not in trusted:
+        return remote
+    # В X-Forwarded-For каждый прокси дописывает адрес справа: берём
+    # первый справа адрес, не принадлежащий нашим прокси
+    for address in reversed(request.META.get(header, '').split(',')):
+        address = address.strip()
+        if address and address not in trusted:
+            return address
+    return remote
+
+
+def counted(request, name):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+        return True
+    return name in getattr(settings, 'RATELIMIT_GET_VIEWS', ())
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limits = getattr(settings, 'RATELIMITS', {})
+        name = request.resolver_match.url_name
+        rate = limits.get(name)
+        if rate is None or not counted(request, name):
+            return None
+        cache = caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+        keys = []
+        if request.user.is_authenticated:
+            keys.append(f'rl:{name}:user:{request.user.pk}')
+        if not keys or getattr(settings, 'RATELIMIT_AUTHENTICATED_IP',
+                               False):
+            keys.append(f'rl:{name}:ip:{client_ip(request)}')
+        for key in keys:
+            retry_after = hit(cache, key, rate)
+            if retry_after is not None:
+                response = HttpResponse(
+                    'Слишком много запросов, попробуйте позже',
+                    status=429,
+                    content_type='text/plain; charset=utf-8'
+                )
+                response['Retry-After'] = math.ceil(retry_after)
+                return response
+        return None
@@ -0,0 +1,201 @@
+"""Раздача пользовательских файлов и статики без фронтового сервера.
+
+Файлы отдаются через ``FileResponse``, поэтому WSGI-сервер может передать
+их через ``os.sendfile`` без чтения в Python. Поддерживаются запросы
+диапазонов (``Range``), строгие ``ETag`` по хэшу содержимого и вечное
+кэширование: имена файлов хранилище никогда не переиспользует. Если перед
+приложением стоит nginx или Apache, отдачу можно переложить на них
+настройками ``MEDIA_ACCEL_REDIRECT`` или ``MEDIA_X_SENDFILE``.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views.decorators.http import require_safe
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Для статики без хэша в имени, например при отсутствии манифеста
+SHORT_CACHE_CONTROL = 'public, max-age=600'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Файловый объект, читающий не больше ``length`` байт с позиции
+    ``start``. Намеренно без ``fileno()``: иначе сервер отправил бы файл
+    через sendfile целиком до конца."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def content_etag(fullpath, stat):
+    """Хэш содержимого файла; считается один раз на версию файла."""
+    key = 'etag:{}:{}:{}'.format(fullpath, stat.st_mtime_ns, stat.st_size)
+    etag = cache.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(fullpath, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        etag = quote_etag(digest.hexdigest()[:32])
+        cache.set(key, etag, None)
+    return etag
+
+
+def parse_range(header, size):
+    """Возвращает (начало, конец включительно) единственного диапазона,
+    ``None`` если заголовок надо проигнорировать, или ``False`` для
+    невыполнимого диапазона."""
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Суффикс: последние N байт
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def resolve(root, path, prefixes):
+    if not path.startswith(prefixes):
+        raise Http404
+    try:
+        fullpath = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    return fullpath
+
+
+def file_response(request, fullpath, content_type=None, headers=None,
+                  offload=True, cache_control=CACHE_CONTROL):
+    """Отдаёт файл с учётом If-None-Match, Range и настроек разгрузки."""
+    stat = os.stat(fullpath)
+    etag = content_etag(fullpath, stat)
+    content_type = content_type or mimetypes.guess_type(fullpath)[0] or \
+        'application/octet-stream'
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    elif offload and getattr(settings, 'MEDIA_ACCEL_REDIRECT', None):
+        response = HttpResponse(content_type=content_type)
+        relative = os.path.relpath(fullpath, settings.MEDIA_ROOT)
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT + relative.replace(os.sep, '/')
+        )
+    elif offload and getattr(settings, 'MEDIA_X_SENDFILE', False):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+    else:
+        response = range_response(request, fullpath, stat, etag)
+        response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def range_response(request, fullpath, stat, etag):
+    size = stat.st_size
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    byte_range = None
+    if header and (not if_range or if_range == etag):
+        byte_range = parse_range(header, size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1))
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        size = end - start + 1
+    response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Картинки записей и их миниатюры из ``MEDIA_ROOT``."""
+    prefixes = getattr(settings, 'MEDIA_SERVE_PREFIXES', ('posts/', 'cache/'))
+    fullpath = resolve(settings.MEDIA_ROOT, path, tuple(prefixes))
+    return file_response(request, fullpath)
+
+
+def accepted_encodings(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00',
+                                           'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+@require_safe
+def serve_static(request, path):
+    """Статика из ``STATIC_ROOT``: отдаёт заранее сжатую копию, если
+    клиент её принимает, а файлы с хэшем в имени кэшируются навсегда."""
+    from django.contrib.staticfiles.storage import staticfiles_storage
+
+    fullpath = resolve(settings.STATIC_ROOT, path, ('',))
+    immutable = getattr(staticfiles_storage, 'is_immutable', None)
+    cache_control = CACHE_CONTROL if immutable and immutable(path) else \
+        SHORT_CACHE_CONTROL
+    content_type = mimetypes.guess_type(fullpath)[0]
+    accepted = accepted_encodings(request)
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            fullpath += suffix
+            break
+    else:
+        encoding = None
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return file_response(
+        request, fullpath, content_type=content_type, headers=headers,
+        offload=False, cache_control=cache_control
+    )
@@ -28,16 +28,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.pagecache.AnonymousPageCacheMiddleware',
+    'posts.memprofile.MemoryProfileMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'yatube.db_router.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# Профилирование памяти запросов (posts.memprofile), включать по
+# необходимости: профилируемые запросы выполняются по одному
+MEMORY_PROFILE = False
+MEMORY_PROFILE_SAMPLE = 1.0
+MEMORY_PROFILE_SITES = 10
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
@@ -66,9 +76,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# PRAGMA, применяемые к каждому соединению SQLite, см. yatube/sqlite.py
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+SQLITE_OPTIMIZE_INTERVAL = 60 * 60
+
+# Реплика только для чтения (например, копия файла SQLite). Чтение ленты и
+# профилей уходит туда, см. yatube/db_router.py
+REPLICA_DATABASE = None
+if os.getenv('DB_REPLICA_NAME'):
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_REPLICA_NAME'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['yatube.db_router.PrimaryReplicaRouter']
+REPLICA_APPS = ('posts', 'auth')
+# Сколько секунд после записи браузер читает из основной базы
+REPLICA_PIN_SECONDS = 10
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -92,16 +129,76 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Имена с хэшем содержимого и сжатые копии .gz/.br, см. yatube/storage.py
+STATICFILES_STORAGE = 'yatube.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Каталоги MEDIA_ROOT, которые раздаёт yatube.serving.serve_media: картинки
+# записей и миниатюры sorl-thumbnail
+MEDIA_SERVE_PREFIXES = ('posts/', 'cache/')
+# Передача отдачи файлов фронтовому серверу: префикс internal-location nginx
+# (например, '/protected-media/') или X-Sendfile для Apache/lighttpd
+MEDIA_ACCEL_REDIRECT = os.getenv('MEDIA_ACCEL_REDIRECT')
+MEDIA_X_SENDFILE = os.getenv('MEDIA_X_SENDFILE') == '1'
 
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = 'index'
 SITE_ID = 1
 
+# Ограничения частоты для пишущих страниц по имени URL, см. yatube/ratelimit.py
+RATELIMITS = {
+    'new_post': '10/m',
+    'add_comment': '20/m',
+    'new_like': '60/m',
+    'dislike': '60/m',
+    'profile_follow': '30/m',
+    'profile_unfollow': '30/m',
+}
+RATELIMIT_CACHE = 'default'
+# Эти представления пишут по GET-ссылке, их GET тоже расходует лимит
+RATELIMIT_GET_VIEWS = ('new_like', 'dislike', 'profile_follow',
+                       'profile_unfollow')
+# Ведро IP-адреса для вошедших пользователей (у анонимных оно есть всегда)
+RATELIMIT_AUTHENTICATED_IP = False
+# За прокси адрес клиента берётся из заголовка, например
+# 'HTTP_X_FORWARDED_FOR', если REMOTE_ADDR - один из доверенных прокси
+RATELIMIT_IP_HEADER = os.getenv('RATELIMIT_IP_HEADER')
+RATELIMIT_TRUSTED_PROXIES = tuple(
+    filter(None, os.getenv('RATELIMIT_TRUSTED_PROXIES', '').split(','))
+)
+
+# Кэш страниц для анонимных посетителей, см. yatube/pagecache.py
+PAGE_CACHE_VIEWS = ('index', 'group', 'group_index', 'profile', 'post',
+                    'trending', 'author_archive', 'author_archive_month',
+                    'group_archive', 'group_archive_month', 'tag')
+# Учёт просмотров страниц, отданных из кэша без вызова представления
+PAGE_CACHE_HIT_HANDLERS = {'post': 'posts.views.post_cache_hit'}
+PAGE_CACHE_MODELS = ('posts.Post', 'posts.Comment', 'posts.Like',
+                     'posts.Follow', 'posts.Group', 'auth.User',
+                     'flatpages.FlatPage')
+PAGE_CACHE_TIMEOUT = 5 * 60
+# Сколько браузеры и прокси хранят архив закончившегося месяца
+ARCHIVE_CACHE_TIMEOUT = 60 * 60
+# Как часто индекс автодополнения сверяет версию в кэше
+AUTOCOMPLETE_CHECK_INTERVAL = 5
+
+# LocMemCache у каждого процесса свой: сброс кэша страниц и версии индекса
+# автодополнения не доходят до других процессов. При нескольких процессах
+# настройте общий кэш
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Фоновые задачи (posts.jobs): письма, в том числе сброс пароля, уходят
+# через очередь, а отправляет их обработчик manage.py run_worker
+EMAIL_BACKEND = 'posts.jobs.QueuedEmailBackend'
+JOBS_EMAIL_BACKEND = os.getenv(
+    'JOBS_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'
+)
+JOBS_VISIBILITY_TIMEOUT = 5 * 60
+JOBS_RETRY_DELAY = 30
+# Сколько хранятся выполненные задачи
+JOBS_DONE_RETENTION = 24 * 60 * 60
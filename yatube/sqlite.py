@@ -0,0 +1,60 @@
+"""Настройка соединений SQLite для работы под нагрузкой.
+
+При открытии соединения применяются PRAGMA из ``SQLITE_PRAGMAS``: журнал
+WAL позволяет читателям не блокировать писателя, ``busy_timeout`` заставляет
+ждать освобождения блокировки вместо мгновенного "database is locked".
+Соединения живут ``CONN_MAX_AGE`` секунд, поэтому раз в
+``SQLITE_OPTIMIZE_INTERVAL`` секунд по окончании запроса выполняется
+``PRAGMA optimize``, обновляющий статистику планировщика.
+"""
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в килобайтах, а не в страницах
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+
+
+def get_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def setup_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, get_pragmas())
+    connection.last_optimize = time.monotonic()
+
+
+@receiver(request_finished)
+def optimize_connections(sender, **kwargs):
+    interval = getattr(settings, 'SQLITE_OPTIMIZE_INTERVAL', 60 * 60)
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.vendor != 'sqlite' or connection.connection is None:
+            continue
+        if now - getattr(connection, 'last_optimize', now) < interval:
+            continue
+        if connection.in_atomic_block:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA optimize')
+        connection.last_optimize = now
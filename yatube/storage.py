@@ -0,0 +1,66 @@
+"""Хранилище статики с хэшами в именах и предварительным сжатием.
+
+``collectstatic`` записывает файлы с хэшем содержимого в имени (их можно
+кэшировать навсегда) и рядом их сжатые копии ``.gz`` и ``.br``. Отдаёт
+их ``yatube.serving.serve_static``. Пакет ``brotli`` указан в
+requirements.txt; без него (например, в окружении для тестов) пишутся
+только ``.gz``.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_EXTENSIONS = (
+    '.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml',
+    '.eot', '.ttf', '.otf',
+)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Без collectstatic (разработка, тесты) ссылки ведут на исходные имена
+    manifest_strict = False
+    min_compress_size = 256
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if name.endswith(COMPRESS_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < self.min_compress_size:
+            return
+        variants = [('.gz', lambda raw: gzip.compress(raw, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress))
+        for suffix, compressor in variants:
+            compressed = compressor(data)
+            # Сжатая копия бесполезна, если не экономит хотя бы 5%
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def is_immutable(self, name):
+        """Имя содержит хэш содержимого - файл можно кэшировать навсегда."""
+        if not hasattr(self, '_hashed_names'):
+            self._hashed_names = frozenset(self.hashed_files.values())
+        return name in self._hashed_names
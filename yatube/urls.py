@@ -1,9 +1,12 @@
+import re
+
 from django.conf import settings
 from django.conf.urls import handler404, handler500
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.flatpages import views
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from yatube.serving import serve_media, serve_static
 
 if settings.DEBUG:
     import debug_toolbar
@@ -34,5 +37,15 @@ urlpatterns = [
 
 if settings.DEBUG:
     urlpatterns += [path('__debug__/', include(debug_toolbar.urls))]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+urlpatterns += [
+    re_path(
+        r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+        serve_media,
+        name='media'
+    ),
+    re_path(
+        r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+        serve_static,
+        name='static'
+    ),
+]